@@ -8,9 +8,13 @@ import tkinter as tk
 from tkinter import messagebox, filedialog
 import tkinter.simpledialog as simpledialog
 import os
+import sys
+import subprocess
+import logging
+import logging.handlers
 import threading
 from queue import Queue, Empty
-from tkinter import scrolledtext
+import numpy as np
 
 # --- アプリケーションのコアモジュール ---
 from app_config import MAP_ROWS, MAP_COLS, CELL_TYPES
@@ -21,11 +25,12 @@ from phits_handler import (generate_environment_input_file,
                            load_and_parse_dose_map, 
                            generate_detailed_simulation_files,
                            execute_phits_simulation,
+                           execute_phits_batch,
                            extract_dose_from_deposit)
 from route_calculator import find_optimal_route, compute_detailed_path_points, resample_path_by_width
 from utils import get_physical_coords
 import visualizer
-from results_exporter import generate_results_csv
+from results_exporter import write_results_csv
 
 # ★デバッグ用のフラグ
 _app_instance_count = 0
@@ -60,6 +65,8 @@ class MainApplication(tk.Tk):
         self.routes = [] # 複数の経路情報を管理するリスト
         self.route_colors = ['red', 'blue', 'green', 'purple', 'orange', 'cyan', 'magenta', 'brown', 'pink', 'gray']
         self.log_queue = Queue()
+        self.log_max_lines = 2000 # ★ログ表示に残す最大行数（古い行から削除する）
+        self.file_logger, self.log_file_path = self._create_file_logger()
         self.result_queue = Queue() # ★結果受け渡し用のキューを追加
         self.latest_results = None # ★最新の結果を保持する変数
 
@@ -103,8 +110,17 @@ class MainApplication(tk.Tk):
         log_frame = tk.LabelFrame(root_pane, text="実行ログ", padx=5, pady=5)
         root_pane.add(log_frame, stretch="never", height=200) # 初期高さを指定
 
-        self.log_text = scrolledtext.ScrolledText(log_frame, state='disabled', wrap=tk.WORD, font=("Meiryo UI", 9))
+        # ★ログ表示は直近の行だけを保持する Listbox にする（全文はログファイルに残す）
+        log_button_frame = tk.Frame(log_frame)
+        log_button_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        tk.Button(log_button_frame, text="ログファイルを開く", command=self.open_log_file).pack(side=tk.RIGHT)
+
+        log_scrollbar = tk.Scrollbar(log_frame, orient=tk.VERTICAL)
+        log_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.log_text = tk.Listbox(log_frame, font=("Meiryo UI", 9), activestyle='none',
+                                   yscrollcommand=log_scrollbar.set)
         self.log_text.pack(fill=tk.BOTH, expand=True)
+        log_scrollbar.config(command=self.log_text.yview)
 
         # --- 4. ステータスバー ---
         self.status_var = tk.StringVar(value="準備完了")
@@ -128,7 +144,7 @@ class MainApplication(tk.Tk):
                 else:
                     self.log("全経路の処理が完了しました。結果をプロットします。")
                     self.latest_results = result # ★結果をインスタンス変数に保持
-                    self.sim_controls_view.save_csv_button.config(state="normal") # ★ボタンを有効化
+                    self.sim_controls_view.set_save_csv_enabled(True) # ★ボタンを有効化
                     
                     # --- 経路データに total_dose と結果を格納してツリーを更新 ---
                     for i, route in enumerate(self.routes):
@@ -167,7 +183,13 @@ class MainApplication(tk.Tk):
                 else:
                     messagebox.showinfo("環境シミュレーション完了", message)
 
-            # 3. その他のエラーメッセージ (文字列型)
+            # 3. マップファイルの保存・読み込みの完了通知 (タプル型)
+            elif isinstance(result, tuple) and result[0] == "map_saved":
+                self.on_map_saved(result[1], result[2])
+            elif isinstance(result, tuple) and result[0] == "map_loaded":
+                self.on_map_loaded(result[1], result[2])
+
+            # 4. その他のエラーメッセージ (文字列型)
             elif isinstance(result, str):
                 self.log(f"処理中にエラーが発生しました: {result}")
                 messagebox.showerror("処理エラー", result)
@@ -179,18 +201,22 @@ class MainApplication(tk.Tk):
 
     def process_log_queue(self):
         """ログメッセージキューを処理して、表示を更新"""
+        # ★キューに溜まったメッセージはまとめて1回で追記し、スクロールも1回だけ行う
+        messages = []
         try:
             while True:
-                message = self.log_queue.get_nowait()
-                # ScrolledTextにログを追記
-                self.log_text.configure(state='normal')
-                self.log_text.insert(tk.END, message + '\n')
-                self.log_text.configure(state='disabled')
-                self.log_text.see(tk.END) # 自動で最終行までスクロール
-
+                messages.append(self.log_queue.get_nowait())
         except Empty:
             pass # キューが空なら何もしない
         finally:
+            if messages:
+                # ログ表示に追記（複数行のメッセージは1行ずつの項目に分ける）
+                self.log_text.insert(tk.END, *'\n'.join(messages).split('\n'))
+                # ★上限行数を超えた古い行は一括で削除し、ウィジェットが際限なく大きくならないようにする
+                line_count = self.log_text.size()
+                if line_count > self.log_max_lines:
+                    self.log_text.delete(0, line_count - self.log_max_lines - 1)
+                self.log_text.see(tk.END) # 自動で最終行までスクロール
             self.after(100, self.process_log_queue)
 
     # ==========================================================================
@@ -211,7 +237,7 @@ class MainApplication(tk.Tk):
     def on_cell_hover(self, r, c):
         x_min, x_max, y_min, y_max, _, _ = get_physical_coords(r, c)
         dose_info = ""
-        if self.dose_map and self.dose_map[r][c] > 0:
+        if self.dose_map is not None and self.dose_map[r][c] > 0:
              dose_info = f" | Dose: {self.dose_map[r][c]:.2e}"
         info = f"Grid[{r},{c}] | X:{x_min:.1f}-{x_max:.1f}, Y:{y_min:.1f}-{y_max:.1f} (cm){dose_info}"
         self.status_var.set(info)
@@ -292,7 +318,7 @@ class MainApplication(tk.Tk):
         """ユーザ操作で deposit.out を読み込み、ヒートマップを適用する（別ボタン）。"""
         self.log("線量マップ読み込みを開始します...")
         dose_data = load_and_parse_dose_map()
-        if dose_data:
+        if dose_data is not None:
             self.dose_map = dose_data
             self.map_editor_view.apply_heatmap(self.dose_map, self.map_data)
             self.log("線量マップを読み込み、ヒートマップを適用しました。")
@@ -446,9 +472,9 @@ class MainApplication(tk.Tk):
             messagebox.showerror("エラー", "スタートまたはゴールが設定されていません。")
             return
         
-        if not self.dose_map:
+        if self.dose_map is None:
             messagebox.showinfo("情報", "線量マップが読み込まれていません。線量なしで可視化します。")
-            self.dose_map = [[0.0 for _ in range(MAP_COLS)] for _ in range(MAP_ROWS)]
+            self.dose_map = np.zeros((MAP_ROWS, MAP_COLS))
         
         # 評価値を記録しながらA*を実行
         from route_calculator import run_astar
@@ -508,12 +534,9 @@ class MainApplication(tk.Tk):
             return
 
         try:
-            # CSVデータを生成
-            csv_data = generate_results_csv(self.latest_results, self.routes)
-            
-            # ファイルに書き込み
+            # CSVデータを文字列にまとめず、ファイルへ直接書き込む
             with open(filepath, 'w', newline='', encoding='utf-8-sig') as f:
-                f.write(csv_data)
+                write_results_csv(f, self.latest_results, self.routes)
             
             self.log(f"結果をCSVファイルに正常に保存しました: {filepath}")
             messagebox.showinfo("保存成功", f"結果をCSVファイルに保存しました。\n{filepath}")
@@ -526,7 +549,7 @@ class MainApplication(tk.Tk):
         """マップをJSONファイルとして保存するダイアログを表示"""
         filepath = filedialog.asksaveasfilename(
             defaultextension=".json",
-            filetypes=[("JSON Files", "*.json"), ("All Files", "*.*")],
+            filetypes=[("JSON Files", "*.json"), ("NumPy Files", "*.npy"), ("Compressed NumPy Files", "*.npz"), ("All Files", "*.*")],
             initialfile="map_layout.json",
             title="マップを保存"
         )
@@ -535,8 +558,14 @@ class MainApplication(tk.Tk):
             self.log("マップ保存がキャンセルされました。")
             return
 
-        from utils import save_map_to_json
-        if save_map_to_json(self.map_data, filepath):
+        # ★ファイルの書き込みはバックグラウンドで行い、完了通知は結果キュー経由でメインスレッドに渡す
+        from utils import save_map_to_json_async
+        save_map_to_json_async(self.map_data, filepath,
+                               lambda ok: self.result_queue.put(("map_saved", filepath, ok)))
+
+    def on_map_saved(self, filepath, ok):
+        """マップ保存の完了後に、結果をログとダイアログで通知する（メインスレッドで実行）"""
+        if ok:
             self.log(f"マップを保存しました: {filepath}")
             messagebox.showinfo("保存成功", f"マップを保存しました。\n{filepath}")
         else:
@@ -546,7 +575,7 @@ class MainApplication(tk.Tk):
     def load_map_dialog(self):
         """マップをJSONファイルから読み込むダイアログを表示"""
         filepath = filedialog.askopenfilename(
-            filetypes=[("JSON Files", "*.json"), ("All Files", "*.*")],
+            filetypes=[("JSON Files", "*.json"), ("NumPy Files", "*.npy"), ("Compressed NumPy Files", "*.npz"), ("All Files", "*.*")],
             title="マップを読み込み"
         )
 
@@ -554,8 +583,13 @@ class MainApplication(tk.Tk):
             self.log("マップ読み込みがキャンセルされました。")
             return
 
-        from utils import load_map_from_json
-        loaded_map = load_map_from_json(filepath)
+        # ★ファイルの読み込みはバックグラウンドで行い、マップの反映はメインスレッドで行う
+        from utils import load_map_from_json_async
+        load_map_from_json_async(filepath,
+                                 lambda loaded_map: self.result_queue.put(("map_loaded", filepath, loaded_map)))
+
+    def on_map_loaded(self, filepath, loaded_map):
+        """読み込んだマップをアプリケーションに反映する（メインスレッドで実行）"""
         if loaded_map is None:
             self.log(f"マップ読み込みエラー")
             messagebox.showerror("読み込みエラー", "マップ読み込み中にエラーが発生しました。")
@@ -666,8 +700,53 @@ class MainApplication(tk.Tk):
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         log_entry = f"[{timestamp}] {message}"
         print(log_entry)
+        if self.file_logger is not None:
+            self.file_logger.info(log_entry)
         self.log_queue.put(log_entry)
 
+    def _create_file_logger(self):
+        """
+        ログの全文を書き出すファイルロガーを作成する。
+        出力先と接頭辞は config.ini の [Logging] から取得し、一定サイズごとにファイルを切り替える。
+
+        Returns:
+            tuple: (logging.Logger, ログファイルのパス)。作成できなかった場合は (None, None)
+        """
+        log_dir = self.config_manager.get_log_directory()
+        if not os.path.isabs(log_dir):
+            log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), log_dir)
+        log_path = os.path.join(log_dir, f"{self.config_manager.get_log_prefix()}.log")
+        try:
+            os.makedirs(log_dir, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                log_path, maxBytes=5 * 1024 * 1024, backupCount=3, encoding='utf-8')
+        except OSError as e:
+            print(f"ログファイルを作成できませんでした: {e}")
+            return None, None
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger = logging.getLogger("phits_map_edit")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        logger.handlers.clear()
+        logger.addHandler(handler)
+        return logger, log_path
+
+    def open_log_file(self):
+        """ログファイルの全文を既定のアプリケーションで開く"""
+        if self.log_file_path is None or not os.path.exists(self.log_file_path):
+            messagebox.showinfo("情報", "ログファイルがありません。")
+            return
+        try:
+            if hasattr(os, 'startfile'):
+                os.startfile(self.log_file_path)
+            else:
+                # os.startfile は Windows 専用のため、それ以外では OS 標準のコマンドで開く
+                opener = "open" if sys.platform == "darwin" else "xdg-open"
+                subprocess.Popen([opener, self.log_file_path])
+        except Exception as e:
+            self.log(f"ログファイルを開けません: {e}")
+            messagebox.showerror("エラー", f"ログファイルを開けません:\n{e}")
+
     def run_phits_and_plot_worker(self):
         """
         「4. 詳細線量評価」で生成済みの入力ファイル群を元に、PHITSを実行し、結果をプロットする。
@@ -727,14 +806,13 @@ class MainApplication(tk.Tk):
             doses_for_route = []
             
             # 4. 各 `.inp` ファイルに対してPHITSを実行
-            for inp_path in inp_files:
+            # ★評価点ごとの実行は互いに独立なため、複数のPHITSを並列に走らせ、結果は入力順に受け取る
+            #   run_* フォルダの作成と input.inp へのコピーは execute_phits_simulation 内で行われる
+            self.log(f"{route_name}: {len(inp_files)} 件のPHITS実行を並列で開始します...")
+            for inp_path, success, result in execute_phits_batch(inp_files, phits_command):
                 completed_sims += 1
                 progress = f"({completed_sims}/{total_sims})"
-                self.log(f"{progress} {os.path.basename(inp_path)} のPHITS実行中...")
-                
-                # phits_handler に inp_path を渡して実行を依頼
-                # run_* フォルダの作成と input.inp へのコピーは execute_phits_simulation 内で行われる
-                success, result = execute_phits_simulation(inp_path, phits_command)
+                self.log(f"{progress} {os.path.basename(inp_path)} のPHITS実行が終了しました。")
                 
                 if not success:
                     error_msg = f"PHITS実行エラー ({os.path.basename(inp_path)}):\n{result}"
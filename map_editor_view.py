@@ -6,10 +6,16 @@
 
 import tkinter as tk
 from tkinter import messagebox
+import tkinter.font as tkFont
 import math
 from app_config import MAP_ROWS, MAP_COLS, CELL_TYPES, CELL_SIZE_X, CELL_SIZE_Y
 from utils import get_physical_coords
 
+# グリッド1マスの表示サイズ (px)
+CELL_PIXELS = 40
+# 軸ラベル用の余白 (px)
+AXIS_MARGIN = 40
+
 class MapEditorView(tk.Frame):
     def __init__(self, master, on_cell_click_callback, on_hover_callback):
         super().__init__(master)
@@ -19,9 +25,11 @@ class MapEditorView(tk.Frame):
         self.main_app = None  # ★main.py からセットされる（save/load用）
 
         self.current_tool = tk.StringVar(value="床 (通行可)")
-        
-        self.grid_buttons = [] # グリッドのボタンウィジェットを保持
 
+        # ツールボタンで共有するフォントと文字色（ウィジェットごとに生成しない）
+        self._tool_font = tkFont.Font(family="Meiryo UI", size=11)
+        self._fg_for = {"black": "white", "red": "white", "blue": "white"}
+        
         self.create_widgets()
 
     def create_widgets(self):
@@ -32,7 +40,7 @@ class MapEditorView(tk.Frame):
 
         # --- 2. 右側のマップグリッド ---
         grid_container = tk.Frame(self)
-        grid_container.pack(side=tk.RIGHT, padx=10, pady=10)
+        grid_container.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True, padx=10, pady=10)
         self.create_map_grid(grid_container)
 
     def create_toolbox(self, parent):
@@ -50,8 +58,8 @@ class MapEditorView(tk.Frame):
                 background=color,
                 selectcolor=color,
                 activebackground=color,
-                font=("Meiryo UI", 11),
-                fg="white" if color in ["black", "red", "blue"] else "black",
+                font=self._tool_font,
+                fg=self._fg_for.get(color, "black"),
                 relief=tk.RAISED,
                 bd=2
             )
@@ -69,61 +77,159 @@ class MapEditorView(tk.Frame):
                  width=12, font=("Meiryo UI", 10), bg="#87CEEB").pack(pady=5, padx=5, fill=tk.X)
 
     def create_map_grid(self, parent):
-        # ★grid レイアウト用の内部フレームを作成（parent は pack で管理されているため）
+        # ★Canvas 上に、スクロール表示範囲内のマスだけを描画する（仮想化）
+        #   描画コストが表示マス数に比例するため、マップサイズに依存しない
         grid_frame = tk.Frame(parent)
         grid_frame.pack(fill=tk.BOTH, expand=True)
 
+        total_width = AXIS_MARGIN + MAP_COLS * CELL_PIXELS
+        total_height = AXIS_MARGIN + MAP_ROWS * CELL_PIXELS
+
+        self.canvas = tk.Canvas(
+            grid_frame,
+            width=total_width,
+            height=total_height,
+            bg="#e0e0e0",
+            highlightthickness=0,
+            scrollregion=(0, 0, total_width, total_height),
+            xscrollincrement=CELL_PIXELS,
+            yscrollincrement=CELL_PIXELS
+        )
+        vsb = tk.Scrollbar(grid_frame, orient=tk.VERTICAL, command=self.canvas.yview)
+        hsb = tk.Scrollbar(grid_frame, orient=tk.HORIZONTAL, command=self.canvas.xview)
+        # スクロール位置が変わるたびに表示範囲のマスを描画し直す
+        self.canvas.configure(
+            xscrollcommand=lambda first, last: self._on_canvas_scrolled(hsb, first, last),
+            yscrollcommand=lambda first, last: self._on_canvas_scrolled(vsb, first, last)
+        )
+
+        self.canvas.grid(row=0, column=0, sticky="nsew")
+        vsb.grid(row=0, column=1, sticky="ns")
+        hsb.grid(row=1, column=0, sticky="ew")
+        grid_frame.grid_rowconfigure(0, weight=1)
+        grid_frame.grid_columnconfigure(0, weight=1)
+
         # --- X軸ラベル (上部) ---
         for c in range(0, MAP_COLS, 5):
             x_val = c * CELL_SIZE_X
-            lbl = tk.Label(grid_frame, text=f"{x_val:.0f}", font=("Meiryo UI", 9, "bold"), bg="#e0e0e0")
-            lbl.grid(row=0, column=c+1, sticky="ew", padx=1, pady=1) 
+            self.canvas.create_text(
+                AXIS_MARGIN + c * CELL_PIXELS + CELL_PIXELS / 2, AXIS_MARGIN / 2,
+                text=f"{x_val:.0f}", font=("Meiryo UI", 9, "bold")
+            )
 
         # --- Y軸ラベル (左側) ---
         for r in range(0, MAP_ROWS, 5):
             y_val = (MAP_ROWS - r) * CELL_SIZE_Y
-            lbl = tk.Label(grid_frame, text=f"{y_val:.0f}", width=5, anchor="e", font=("Meiryo UI", 9, "bold"), bg="#e0e0e0")
-            lbl.grid(row=r+1, column=0, sticky="ns", padx=1, pady=1)
+            self.canvas.create_text(
+                AXIS_MARGIN - 4, AXIS_MARGIN + r * CELL_PIXELS + CELL_PIXELS / 2,
+                text=f"{y_val:.0f}", anchor="e", font=("Meiryo UI", 9, "bold")
+            )
 
-        # --- グリッドボタン本体 ---
-        for r in range(MAP_ROWS):
-            row_buttons = []
-            for c in range(MAP_COLS):
-                btn = tk.Button(
-                    grid_frame,
-                    text="",
-                    width=4,
-                    height=2,
-                    bg=CELL_TYPES["床 (通行可)"][1],
-                    activebackground="#ffffff",
-                    relief=tk.SOLID,
-                    bd=1,
-                    command=lambda r_val=r, c_val=c: self.on_cell_click_callback(r_val, c_val)
+        # --- マスの色（表示の有無に関わらず保持するモデル） ---
+        floor_color = CELL_TYPES["床 (通行可)"][1]
+        self._cell_colors = [[floor_color] * MAP_COLS for _ in range(MAP_ROWS)]
+        self._cell_items = {}  # (r, c) -> Canvas アイテムID（表示範囲内のマスのみ）
+        self._hover_cell = None
+
+        self.canvas.bind("<Configure>", lambda event: self._render_visible())
+        self.canvas.bind("<MouseWheel>", self._on_mousewheel)
+        self.canvas.bind("<Shift-MouseWheel>", self._on_shift_mousewheel)
+        self.canvas.bind("<Button-1>", self._on_canvas_click)
+        self.canvas.bind("<Motion>", self._on_canvas_motion)
+        self.canvas.bind("<Leave>", lambda event: setattr(self, "_hover_cell", None))
+
+    def _on_canvas_scrolled(self, scrollbar, first, last):
+        """スクロールバーを更新し、新たに表示されたマスを描画する"""
+        scrollbar.set(first, last)
+        self._render_visible()
+
+    def _on_mousewheel(self, event):
+        self.canvas.yview_scroll(int(-event.delta / 120), "units")
+
+    def _on_shift_mousewheel(self, event):
+        self.canvas.xview_scroll(int(-event.delta / 120), "units")
+
+    def _visible_range(self):
+        """表示範囲に含まれるマスの (r_min, r_max, c_min, c_max) を返す"""
+        x0 = self.canvas.canvasx(0)
+        y0 = self.canvas.canvasy(0)
+        x1 = self.canvas.canvasx(self.canvas.winfo_width())
+        y1 = self.canvas.canvasy(self.canvas.winfo_height())
+
+        c_min = max(0, int((x0 - AXIS_MARGIN) // CELL_PIXELS))
+        c_max = min(MAP_COLS - 1, int((x1 - AXIS_MARGIN) // CELL_PIXELS))
+        r_min = max(0, int((y0 - AXIS_MARGIN) // CELL_PIXELS))
+        r_max = min(MAP_ROWS - 1, int((y1 - AXIS_MARGIN) // CELL_PIXELS))
+        return r_min, r_max, c_min, c_max
+
+    def _render_visible(self):
+        """表示範囲外のマスを削除し、表示範囲に入ったマスを作成する"""
+        r_min, r_max, c_min, c_max = self._visible_range()
+
+        hidden = [key for key in self._cell_items
+                  if not (r_min <= key[0] <= r_max and c_min <= key[1] <= c_max)]
+        for key in hidden:
+            self.canvas.delete(self._cell_items.pop(key))
+
+        for r in range(r_min, r_max + 1):
+            y = AXIS_MARGIN + r * CELL_PIXELS
+            for c in range(c_min, c_max + 1):
+                if (r, c) in self._cell_items:
+                    continue
+                x = AXIS_MARGIN + c * CELL_PIXELS
+                self._cell_items[(r, c)] = self.canvas.create_rectangle(
+                    x + 1, y + 1, x + CELL_PIXELS - 1, y + CELL_PIXELS - 1,
+                    fill=self._cell_colors[r][c], outline="black"
                 )
-                btn.grid(row=r+1, column=c+1, sticky="nsew", padx=1, pady=1)
-                
-                btn.bind("<Enter>", lambda event, r_val=r, c_val=c: self.on_hover_callback(r_val, c_val))
-                
-                row_buttons.append(btn)
-            self.grid_buttons.append(row_buttons)
+
+    def _cell_at(self, event):
+        """イベント座標に対応するマス (r, c) を返す。グリッド外なら None"""
+        x = self.canvas.canvasx(event.x) - AXIS_MARGIN
+        y = self.canvas.canvasy(event.y) - AXIS_MARGIN
+        if x < 0 or y < 0:
+            return None
+        r = int(y // CELL_PIXELS)
+        c = int(x // CELL_PIXELS)
+        if r >= MAP_ROWS or c >= MAP_COLS:
+            return None
+        return r, c
+
+    def _on_canvas_click(self, event):
+        cell = self._cell_at(event)
+        if cell is not None:
+            self.on_cell_click_callback(*cell)
+
+    def _on_canvas_motion(self, event):
+        # マスが変わったときだけホバー処理を呼ぶ
+        cell = self._cell_at(event)
+        if cell is None or cell == self._hover_cell:
+            return
+        self._hover_cell = cell
+        self.on_hover_callback(*cell)
 
     def update_cell_color(self, r, c, color):
         """指定されたセルの色を更新する"""
-        self.grid_buttons[r][c].config(bg=color)
+        self._cell_colors[r][c] = color
+        item = self._cell_items.get((r, c))
+        if item is not None:
+            self.canvas.itemconfig(item, fill=color)
 
     def apply_heatmap(self, dose_map, map_data):
         """線量マップデータに基づいてヒートマップを適用する"""
-        if not dose_map: return
+        if dose_map is None: return
 
-        # 0より大きい値のみを対象に最大・最小を計算
-        flat_list = [val for row in dose_map for val in row if val > 0]
-        if not flat_list: 
+        # 0より大きい値のみを対象に最大・最小を計算（中間リストを作らず1回の走査で求める）
+        min_dose = math.inf
+        max_dose = 0.0
+        for row in dose_map:
+            for val in row:
+                if val > 0:
+                    if val < min_dose: min_dose = val
+                    if val > max_dose: max_dose = val
+        if max_dose <= 0:
             messagebox.showinfo("可視化情報", "線量データが全て0以下のため、ヒートマップは適用されません。")
             return
         
-        max_dose = max(flat_list)
-        min_dose = min(flat_list)
-        
         if max_dose <= min_dose: return
 
         log_min = math.log10(min_dose)
@@ -145,7 +251,7 @@ class MapEditorView(tk.Frame):
                 ratio = max(0.0, min(1.0, ratio)) # 0.0-1.0の範囲に収める
                 
                 color_code = self.get_heatmap_color(ratio)
-                self.grid_buttons[r][c].config(bg=color_code)
+                self.update_cell_color(r, c, color_code)
         
         messagebox.showinfo("完了", f"線量マップを可視化しました。\\n最大: {max_dose:.2e}\\n最小: {min_dose:.2e}")
 
@@ -178,9 +284,15 @@ class MapEditorView(tk.Frame):
                     self.update_cell_color(r, c, color)
     def visualize_path(self, path, map_data):
         """指定された経路をマップ上に描画する"""
+        # ★表示中のマスにタグを付けておき、色の変更は itemconfig 1回で行う
         for r, c in path:
             cell_id = map_data[r][c]
             # スタート、ゴール、中継、線源のマスは上書きしない
             if cell_id not in [0, 1]:
                 continue
-            self.update_cell_color(r, c, "magenta")
+            self._cell_colors[r][c] = "magenta"
+            item = self._cell_items.get((r, c))
+            if item is not None:
+                self.canvas.addtag_withtag("path_highlight", item)
+        self.canvas.itemconfig("path_highlight", fill="magenta")
+        self.canvas.dtag("path_highlight")
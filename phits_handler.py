@@ -4,22 +4,164 @@
 PHITSの入力ファイル生成、実行、出力解析など、PHITS関連の処理を担うモジュール。
 """
 
-import textwrap
+import functools
+import hashlib
+import io
+import itertools
+import mmap
 import re
 import os
 import shutil
+import signal
 import subprocess
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
 from tkinter import filedialog, messagebox
 
 from app_config import (MAP_ROWS, MAP_COLS, CELL_SIZE_X, CELL_SIZE_Y, 
                         CELL_HEIGHT_Z, WORLD_MARGIN)
-from utils import get_physical_coords
 from config_loader import get_config
+from utils import build_coord_grid
+
+# マップ内容のハッシュ -> (Surface セクション, Cell セクション, 線源座標) のキャッシュ
+_GEOMETRY_CACHE = {}
+_GEOMETRY_CACHE_SIZE = 8
+
+# 詳細評価用のテンプレート
+_TEMPLATE_PATH = os.path.join(os.path.dirname(__file__), 'template.inp')
+
+# 詳細入力ファイルの生成をプロセスプールで並列化する最小の評価点数
+_PARALLEL_MIN_POINTS = 64
+
+# プロセスプールの各ワーカーが保持する環境ファイルの解析結果 (_init_point_worker で設定)
+_worker_env = None
+
+# PHITS実行の制限時間（秒）
+_PHITS_TIMEOUT_SEC = 600
+
+# PHITS実行ログのうち、メッセージに含める末尾のバイト数
+_LOG_TAIL_BYTES = 8 * 1024
+
+# --- 正規表現（ループ内で毎回コンパイルしないようモジュールレベルで保持） ---
+# セクションヘッダ (例: "[ C e l l ]")
+_HEADER_RE = re.compile(r'^\s*\[\s*([^\]]+?)\s*\]', re.IGNORECASE)
+_NON_ALNUM_RE = re.compile(r'[^a-zA-Z0-9]')
+# ID の採番用
+_MAT_ID_RE = re.compile(r'^\s*mat\s*\[\s*(\d+)\s*\]', re.IGNORECASE)
+_LEADING_ID_RE = re.compile(r'^\s*(\d+)\s+')
+_TRANS_ID_RE = re.compile(r'^\s*\*?Tr(\d+)', re.IGNORECASE)
+# セル行の参照更新用
+_CELL_LINE_RE = re.compile(r'^\s*(\d+)\s+(-?\d+)\s+([^ ]+)\s+(.*)', re.IGNORECASE)
+# trcl=N（Transform参照）と +N/-N/#N（Surface参照）を1回の走査で置換する
+_CELL_REFS_RE = re.compile(r'(trcl\s*=\s*\(?\s*)(\d+)(\s*\)?)|([+\-#])(\d+)', re.IGNORECASE)
+# ID種別ごとの (セクション名, IDを取り出す正規表現)
+_ID_TYPES = {
+    'mat': ('material', _MAT_ID_RE),
+    'cell': ('cell', _LEADING_ID_RE),
+    'surf': ('surface', _LEADING_ID_RE),
+    'trans': ('transform', _TRANS_ID_RE),
+}
+# 検出器セル / Airセルの判定用
+_DETECTOR_CELL_RE = re.compile(r'^\s*(\d+)\s+.*trcl=1', re.IGNORECASE)
+_AIR_CELL_RE = re.compile(r'^\s*1000\s+')
+# template.inp のプレースホルダ
+_PLACEHOLDER_RE = re.compile(r'\{(det_[xyz]|nuclide_name|activity_value|maxcas_value|maxbch_value|detector_cell_id)\}')
+# 環境ファイル内のセルID
+_CELL_ID_RE = re.compile(r'^\s*(\d+)\s+\d+')
+# 出力ファイルの数値解析用
+_NUM_RE = re.compile(rb'[-+]?(?:\d+\.\d*|\.\d+|\d+)(?:[eE][-+]?\d+)?')
+# 数字を含む行かどうかの判定用（バイト列の各要素は int のため、数字のバイト値の集合で判定する）
+_DIGIT_BYTES = frozenset(b'0123456789')
+# PHITSの標準出力に現れる致命的エラーの判定用
+# 行頭（空白と "***" などの記号の後）の "fatal" / "Error:" のエラー表示だけを対象にし、
+# "non-fatal" や行の途中に現れる語（入力のコメント・ファイル名など）では中断しない
+_FATAL_RE = re.compile(rb'^[ \t]*(?:\*+[ \t]*)?(?:fatal\b|error[ \t]*[:!])', re.IGNORECASE)
+# deposit.out のコメント行と、mesh=reg の結果テーブルのヘッダーに含まれる語
+_COMMENT_LINE_RE = re.compile(rb'^[ \t\f\v]*#[^\n]*', re.MULTILINE)
+_REG_TABLE_HEADER_KEYWORDS = (b'num', b'reg', b'volume', b'all')
+_FLOAT_TOKEN_RE = re.compile(rb'^[+-]?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?$')
+
+# --- 環境定義ファイルの固定部分のテンプレート ---
+_ENV_HEADER_TMPL = (
+    "[ T i t l e ]\n"
+    "Environment Definition for Dose Map Calculation\n"
+    "\n\n"
+    "[ P a r a m e t e r s ]\n"
+    "   maxcas   = {maxcas}\n"
+    "   maxbch   = {maxbch}\n"
+    "\n\n"
+    "[ M a t e r i a l ]\n"
+    "  mat[1]   N 8 O 2         $ Air\n"
+    "  mat[2]   H -0.023          $ Concrete\n"
+    "           C -0.0023 \n"
+    "           O -1.22 \n"
+    "           Na -0.0368\n"
+    "           Mg -0.005\n"
+    "           Al -0.078\n"
+    "           Si -0.775\n"
+    "           K -0.0299\n"
+    "           Ca -0.1\n"
+    "           Fe -0.032\n"
+    "\n\n"
+)
+
+_SRC_TMPL = """\
+[ S o u r c e ]
+   s-type = 1             $ Point source
+     proj = photon
+       x0 = {x:.3f}
+       y0 = {y:.3f}
+       z0 = {z:.3f}
+       z1 = {z:.3f}
+      dir = all          $ Isotropic
+   e-type = 28             $ RI source
+       ni = 1
+     {nuclide} {activity:.1e}      $ {activity:.1e} Bq
+    dtime = -10.0
+     norm = 0              $ Output in [/sec]
+
+
+"""
+
+_NO_SOURCE_TEXT = """\
+[ S o u r c e ]
+$ --- 警告: 線源がマップ上に配置されていません ---
+
+
+"""
+
+_TDEPOSIT_TMPL = """\
+[ T - D e p o s i t ]
+    title = Dose Map for A* Algorithm
+     mesh = xyz            $ xyzメッシュを指定
+   x-type = 2
+       nx = {nx}
+     xmin = 0.0
+     xmax = {xmax:.1f}
+   y-type = 2
+       ny = {ny}
+     ymin = 0.0
+     ymax = {ymax:.1f}
+   z-type = 2
+       nz = 1
+     zmin = 0.0
+     zmax = {zmax:.1f}
+     unit = 0              $ [Gy/source] で出力
+   output = dose
+     axis = xy
+     file = deposit_xy.out
+     part = all
+   epsout = 1
+
+
+"""
 
 def generate_environment_input_file(map_data, nuclide=None, activity=None):
     """
-    現在のマップデータから、環境定義用のPHITS入力ファイル文字列を生成し、
-    ファイル保存ダイアログを表示して保存する。
+    ファイル保存ダイアログを表示し、現在のマップデータから生成した
+    環境定義用のPHITS入力ファイルを保存する。
     """
     config = get_config()
     if nuclide is None:
@@ -29,58 +171,120 @@ def generate_environment_input_file(map_data, nuclide=None, activity=None):
     
     maxcas = config.get_default_maxcas()
     maxbch = config.get_default_maxbch()
+
+    # ★保存先を先に決め、入力ファイル全体を1つの文字列にまとめずにセクションごとに書き込む
+    filepath = filedialog.asksaveasfilename(
+        defaultextension=".inp",
+        filetypes=[("PHITS Input", "*.inp"), ("All Files", "*.*")],
+        initialfile="env_input.inp",
+        title="環境定義ファイル (env_input.inp) として保存"
+    )
     
-    phits_input_lines = [
-        "[ T i t l e ]",
-        "Environment Definition for Dose Map Calculation",
-        "\n",
-        "[ P a r a m e t e r s ]",
-        f"   maxcas   = {maxcas}",
-        f"   maxbch   = {maxbch}",
-        "\n",
-        "[ M a t e r i a l ]",
-        "  mat[1]   N 8 O 2         $ Air",
-        "  mat[2]   H -0.023          $ Concrete",
-        "           C -0.0023 ",
-        "           O -1.22 ",
-        "           Na -0.0368",
-        "           Mg -0.005",
-        "           Al -0.078",
-        "           Si -0.775",
-        "           K -0.0299",
-        "           Ca -0.1",
-        "           Fe -0.032",
-        "\n"
-    ]
-
-    surface_lines = ["[ S u r f a c e ]"]
-    cell_lines = ["[ C e l l ]"]
+    if not filepath: return None
+
+    try:
+        with open(filepath, 'w', encoding='utf-8', buffering=1 << 20) as f:
+            _write_environment_input(f, map_data, nuclide, activity, maxcas, maxbch)
+        messagebox.showinfo("生成成功", f"保存しました:\n{filepath}")
+        return filepath  # ★成功時にファイルパスを返す
+    except Exception as e:
+        messagebox.showerror("保存エラー", f"{e}")
+        return None
+
+
+def _wrap_exclusions(numbers, width=60, indent="      "):
+    """
+    除外セル指定 "#N" を空白区切りで並べ、1行 width 文字以内で折り返した文字列を返す。
+    textwrap.fill(..., width=width, subsequent_indent=indent) と同じ結果を、
+    全体を1つの文字列にしてから分割し直すことなく1回の走査で作る。
+    """
+    lines = []
+    buf = []
+    cur_len = 0
+    limit = width
+    for num in numbers:
+        tok = f"#{num}"
+        if buf and cur_len + 1 + len(tok) > limit:
+            lines.append(" ".join(buf))
+            buf = []
+            cur_len = 0
+            limit = width - len(indent)  # 2行目以降はインデント分だけ短い
+        cur_len += len(tok) + (1 if buf else 0)
+        buf.append(tok)
+    if buf:
+        lines.append(" ".join(buf))
+    return ("\n" + indent).join(lines)
+
+
+def _map_digest(grid):
+    """マップ配列の内容から、キャッシュのキーとするハッシュ値を計算する"""
+    return hashlib.blake2b(grid.astype(np.int8).tobytes(), digest_size=16).digest()
+
+
+def _get_geometry_sections(map_data):
+    """
+    マップから Surface / Cell セクションの文字列と線源座標を返す。
+    マップの編集中は同じ内容で何度も保存されるため、マップ内容のハッシュをキーに結果をキャッシュする。
+    """
+    grid = np.asarray(map_data)
+    key = (grid.shape, _map_digest(grid))
+    cached = _GEOMETRY_CACHE.get(key)
+    if cached is None:
+        cached = _build_geometry_sections(grid)
+        if len(_GEOMETRY_CACHE) >= _GEOMETRY_CACHE_SIZE:
+            # 最も古いエントリを捨てる
+            _GEOMETRY_CACHE.pop(next(iter(_GEOMETRY_CACHE)))
+        _GEOMETRY_CACHE[key] = cached
+    return cached
+
+
+def _build_geometry_sections(grid):
+    """マップ配列から (Surface セクション, Cell セクション, 線源座標のタプル) を生成する"""
+    # ★各セクションは StringIO に書き込む（各行は先頭に改行を付けて書く）
+    surface_buf = io.StringIO()
+    cell_buf = io.StringIO()
+    surface_buf.write("[ S u r f a c e ]")
+    cell_buf.write("[ C e l l ]")
     
-    wall_surface_numbers = []
-    source_coords = []
-    surface_id_counter = 101 
-
-    for r in range(MAP_ROWS):
-        for c in range(MAP_COLS):
-            cell_id = map_data[r][c]
-            x_min, x_max, y_min, y_max, z_min, z_max = get_physical_coords(r, c)
-
-            if cell_id == 1: # 壁
-                s_num = surface_id_counter
-                surface_lines.append(
-                    f"  {s_num}  rpp  {x_min:.1f} {x_max:.1f}  {y_min:.1f} {y_max:.1f}  {z_min:.1f} {z_max:.1f}"
-                )
-                cell_lines.append(
-                    f"  {s_num}    2  -2.302   -{s_num}    $ Wall at GUI(r={r}, c={c})"
-                )
-                wall_surface_numbers.append(s_num)
-                surface_id_counter += 1
-            
-            elif cell_id == 9: # 線源
-                src_x = (x_min + x_max) / 2.0
-                src_y = (y_min + y_max) / 2.0
-                src_z = (z_min + z_max) / 2.0 
-                source_coords.append((src_x, src_y, src_z))
+    # ★全マスをループせず、壁・線源のマスだけを NumPy でまとめて座標計算する
+    #   列ごとの X 範囲・行ごとの Y 範囲を1回だけ計算し、対象マスの行・列で引く
+    z_min = 0.0
+    z_max = CELL_HEIGHT_Z
+
+    col_x_min, col_x_max, row_y_min, row_y_max = build_coord_grid()
+
+    wall_rs, wall_cs = np.nonzero(grid == 1)
+    wall_x_min = col_x_min[wall_cs]
+    wall_x_max = col_x_max[wall_cs]
+    wall_y_min = row_y_min[wall_rs]
+    wall_y_max = row_y_max[wall_rs]
+    wall_surface_numbers = list(range(101, 101 + len(wall_rs)))
+
+    # ★ 壁の Surface / Cell 行は1行ずつ f-string で作らず、列ごとに np.char.mod で文字列化し
+    #   np.char.add で連結して全行をまとめて生成する
+    if wall_surface_numbers:
+        fmt = np.char.mod
+        cat = functools.partial(functools.reduce, np.char.add)
+        nums = fmt("%d", np.asarray(wall_surface_numbers))
+        surface_lines = cat((
+            "\n  ", nums, "  rpp  ",
+            fmt("%.1f", wall_x_min), " ", fmt("%.1f", wall_x_max), "  ",
+            fmt("%.1f", wall_y_min), " ", fmt("%.1f", wall_y_max),
+            f"  {z_min:.1f} {z_max:.1f}",
+        ))
+        cell_lines = cat((
+            "\n  ", nums, "    2  -2.302   -", nums,
+            "    $ Wall at GUI(r=", fmt("%d", wall_rs), ", c=", fmt("%d", wall_cs), ")",
+        ))
+        surface_buf.write("".join(surface_lines.tolist()))
+        cell_buf.write("".join(cell_lines.tolist()))
+
+    # 線源（マスの中心）
+    src_rs, src_cs = np.nonzero(grid == 9)
+    src_xs = ((col_x_min + col_x_max) / 2.0)[src_cs]
+    src_ys = ((row_y_min + row_y_max) / 2.0)[src_rs]
+    src_z = (z_min + z_max) / 2.0
+    source_coords = tuple((x, y, src_z) for x, y in zip(src_xs.tolist(), src_ys.tolist()))
 
     # --- 全体空間 ---
     map_width = MAP_COLS * CELL_SIZE_X
@@ -96,122 +300,110 @@ def generate_environment_input_file(map_data, nuclide=None, activity=None):
     world_z_min = -WORLD_MARGIN
     world_z_max = CELL_HEIGHT_Z + WORLD_MARGIN
 
-    surface_lines.append(
-        f"  {s_world}  rpp  {world_x_min:.1f} {world_x_max:.1f}  {world_y_min:.1f} {world_y_max:.1f}  {world_z_min:.1f} {world_z_max:.1f}"
+    surface_buf.write(
+        f"\n  {s_world}  rpp  {world_x_min:.1f} {world_x_max:.1f}  {world_y_min:.1f} {world_y_max:.1f}  {world_z_min:.1f} {world_z_max:.1f}"
     )
-    surface_lines.append(
-        f"  {s_void} so   {max(map_width, map_height, CELL_HEIGHT_Z) * 10.0}"
+    surface_buf.write(
+        f"\n  {s_void} so   {max(map_width, map_height, CELL_HEIGHT_Z) * 10.0}"
     )
     
-    wall_exclusion_str = " ".join([f"#{num}" for num in wall_surface_numbers])
-    wall_exclusion_wrapped = textwrap.fill(wall_exclusion_str, width=60, subsequent_indent="      ")
+    wall_exclusion_wrapped = _wrap_exclusions(wall_surface_numbers)
 
-    cell_lines.append(
-        f"  1000   1  -1.20E-3  -{s_world} {wall_exclusion_wrapped}   $ Air region"
+    cell_buf.write(
+        f"\n  1000   1  -1.20E-3  -{s_world} {wall_exclusion_wrapped}   $ Air region"
     )
-    cell_lines.append(
-        f"  9000  -1            {s_world}    $ Outside world (void)"
+    cell_buf.write(
+        f"\n  9000  -1            {s_world}    $ Outside world (void)"
     )
-    
-    phits_input_lines.extend(surface_lines)
-    phits_input_lines.append("\n")
-    phits_input_lines.extend(cell_lines)
-    phits_input_lines.append("\n")
+    return surface_buf.getvalue(), cell_buf.getvalue(), source_coords
+
+
+def _write_environment_input(f, map_data, nuclide, activity, maxcas, maxbch):
+    """環境定義用のPHITS入力ファイルの内容を、ファイルオブジェクト f に順に書き込む"""
+    w = f.write
+
+    w(_ENV_HEADER_TMPL.format(maxcas=maxcas, maxbch=maxbch))
+
+    surface_text, cell_text, source_coords = _get_geometry_sections(map_data)
+    w(surface_text)
+    w("\n\n\n")
+    w(cell_text)
+    w("\n\n\n")
 
     # --- 線源定義 (複数対応) ---
     if not source_coords:
-        phits_input_lines.append("[ S o u r c e ]")
-        phits_input_lines.append("$ --- 警告: 線源がマップ上に配置されていません ---")
-        phits_input_lines.append("\n")
+        w(_NO_SOURCE_TEXT)
     else:
+        # 線源ごとに変わるのは座標だけなので、テンプレート1回の format で書き出す
         for src_x, src_y, src_z in source_coords:
-            phits_input_lines.append("[ S o u r c e ]")
-            phits_input_lines.extend([
-                f"   s-type = 1             $ Point source",
-                f"     proj = photon",
-                f"       x0 = {src_x:.3f}",
-                f"       y0 = {src_y:.3f}",
-                f"       z0 = {src_z:.3f}",
-                f"       z1 = {src_z:.3f}",
-                f"      dir = all          $ Isotropic",
-                "   e-type = 28             $ RI source",
-                "       ni = 1",
-                f"     {nuclide} {activity:.1e}      $ {activity:.1e} Bq",
-                "    dtime = -10.0",
-                "     norm = 0              $ Output in [/sec]"
-            ])
-            phits_input_lines.append("\n")
+            w(_SRC_TMPL.format(x=src_x, y=src_y, z=src_z, nuclide=nuclide, activity=activity))
 
     # --- 線量マップ定義 [T-Deposit] ---
-    phits_input_lines.extend([
-        "[ T - D e p o s i t ]",
-        "    title = Dose Map for A* Algorithm",
-        "     mesh = xyz            $ xyzメッシュを指定",
-        "   x-type = 2",
-        f"       nx = {MAP_COLS}",
-        f"     xmin = 0.0",
-        f"     xmax = {map_width:.1f}",
-        "   y-type = 2",
-        f"       ny = {MAP_ROWS}",
-        f"     ymin = 0.0",
-        f"     ymax = {map_height:.1f}",
-        "   z-type = 2",
-        "       nz = 1",
-        f"     zmin = 0.0",
-        f"     zmax = {CELL_HEIGHT_Z:.1f}", 
-        "     unit = 0              $ [Gy/source] で出力",
-        "   output = dose",
-        "     axis = xy",
-        "     file = deposit_xy.out",
-        "     part = all",
-        "   epsout = 1",
-        "\n"
-    ])
-
-    phits_input_lines.append("[ E n d ]\n")
-    final_input_string = "\n".join(phits_input_lines)
-    
-    filepath = filedialog.asksaveasfilename(
-        defaultextension=".inp",
-        filetypes=[("PHITS Input", "*.inp"), ("All Files", "*.*")],
-        initialfile="env_input.inp",
-        title="環境定義ファイル (env_input.inp) として保存"
-    )
-    
-    if not filepath: return None
+    w(_TDEPOSIT_TMPL.format(
+        nx=MAP_COLS, ny=MAP_ROWS,
+        xmax=MAP_COLS * CELL_SIZE_X, ymax=MAP_ROWS * CELL_SIZE_Y, zmax=CELL_HEIGHT_Z
+    ))
 
-    try:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(final_input_string)
-        messagebox.showinfo("生成成功", f"保存しました:\n{filepath}")
-        return filepath  # ★成功時にファイルパスを返す
-    except Exception as e:
-        messagebox.showerror("保存エラー", f"{e}")
-        return None
+    w("[ E n d ]\n")
 
 
 class AdvancedPhitsMerger:
-    def __init__(self, base_content, merge_content):
-        self.append_only_keys = ['source', 'tend']
-        self.overwrite_keys = ['title', 'parameters', 'tdeposit']
-        self.merge_keys = ['material', 'surface', 'cell', 'volume', 'transform']
-
-        self.base_sections = self._parse(base_content)
-        self.merge_sections = self._parse(merge_content)
+    append_only_keys = ['source', 'tend']
+    overwrite_keys = ['title', 'parameters', 'tdeposit']
+    merge_keys = ['material', 'surface', 'cell', 'volume', 'transform']
+
+    def __init__(self, base_content, merge_content=""):
+        """
+        merge_content を省略すると、ベース側だけを解析した結合器になる。
+        同じベースに何度もマージする場合は、これを1回だけ作って merge_with を呼ぶ。
+        """
+        base_sections = self._parse_static(base_content)
+        # ベース側で使用済みのIDはマージ中に変化しないため、1回の走査でまとめて収集しておく
+        self._setup(base_sections, self._scan_base_ids(base_sections), merge_content)
+
+    @classmethod
+    def from_preparsed(cls, base_sections, base_ids, merge_content):
+        """
+        解析済みのベース側セクションとIDの集合から生成する。
+        同じ環境ファイルに何度もマージする場合、解析を1回で済ませるために使う。
+        （マージ処理は行リストを書き換えず、セクションの差し替えだけを行うため、辞書の浅いコピーで足りる）
+        """
+        merger = cls.__new__(cls)
+        merger._setup(dict(base_sections), base_ids, merge_content)
+        return merger
+
+    def merge_with(self, merge_content, out=None):
+        """
+        解析済みのベース側に merge_content をマージする。
+        マージは呼び出しごとの結合器で行い、この結合器のベース側は変更しないため、何度でも呼べる。
+        out を指定した場合はそこへ書き込み、省略した場合はマージ結果の文字列を返す。
+        """
+        merger = self.from_preparsed(self.base_sections, self._base_ids, merge_content)
+        if out is None:
+            return merger.merge()
+        merger.merge_into(out)
+
+    def _setup(self, base_sections, base_ids, merge_content):
+        self.base_sections = base_sections
+        self.merge_sections = self._parse_static(merge_content)
+        self._base_ids = base_ids
         
         self.id_maps = {'mat': {}, 'cell': {}, 'surf': {}, 'trans': {}}
+        # 参照更新の際に見つけた検出器セル (trcl=1) のID
+        self._detector_ids = []
 
-    def _parse(self, text):
+    @classmethod
+    def _parse_static(cls, text):
         sections = {}
-        header_pattern = re.compile(r'^\s*\[\s*([^\]]+?)\s*\]', re.IGNORECASE)
         current_key, current_header = None, None
         
         for i, line in enumerate(text.splitlines()):
-            match = header_pattern.match(line)
+            # ほとんどの行はヘッダではないため、先頭文字で先に絞り込む
+            match = _HEADER_RE.match(line) if line.lstrip()[:1] == '[' else None
             if match:
                 header_text = match.group(0).strip()
-                key = re.sub(r'[^a-zA-Z0-9]', '', match.group(1)).lower()
-                if key in self.append_only_keys:
+                key = _NON_ALNUM_RE.sub('', match.group(1)).lower()
+                if key in cls.append_only_keys:
                     key = f"{key}_{i}"
                 if key not in sections:
                     sections[key] = (header_text, [])
@@ -220,66 +412,63 @@ class AdvancedPhitsMerger:
                 sections[current_key][1].append(line)
         return sections
 
+    @staticmethod
+    def _scan_base_ids(sections):
+        """各セクションを1回だけ走査し、ID種別ごとの使用済みIDの集合を返す"""
+        base_ids = {id_type: set() for id_type in _ID_TYPES}
+        for sec_key, (_, lines) in sections.items():
+            for id_type, (section_name, pattern) in _ID_TYPES.items():
+                if not sec_key.startswith(section_name):
+                    continue
+                ids = base_ids[id_type]
+                for line in lines:
+                    m = pattern.match(line)
+                    if m:
+                        ids.add(int(m.group(1)))
+        return base_ids
+
     def merge(self):
+        """マージ結果を文字列として返す"""
+        out = io.StringIO()
+        self.merge_into(out)
+        return out.getvalue()
+
+    def merge_into(self, out):
+        """マージ結果を、文字列にまとめずにテキストストリーム out へ直接書き込む"""
         self._renumber_and_map_ids()
         self._update_references()
 
         # --- 新しいロジック: Airセル(ID:1000)に検出器セルIDを除外として追加 ---
-        try:
-            # 1. マージされる検出器セルのIDを取得 (renumber後の新しいID)
-            detector_cell_pattern = re.compile(r'^\s*(\d+)\s+.*trcl=1', re.IGNORECASE)
-            merge_detector_ids = []
-            if 'cell' in self.merge_sections:
-                for line in self.merge_sections['cell'][1]:
-                    match = detector_cell_pattern.match(line)
-                    if match:
-                        # マッピング辞書を使って、元のIDから新しいIDを取得する必要はない
-                        # self.merge_sectionsは既にrenumberされているため、ここにあるIDが新しいID
-                        new_id = int(match.group(1))
-                        merge_detector_ids.append(new_id)
-            
-            # 2. ベースのAirセル(ID:1000)の行を特定し、除外IDを追加
-            if 'cell' in self.base_sections and merge_detector_ids:
-                air_cell_pattern = re.compile(r'^\s*1000\s+')
-                new_base_cell_lines = []
-                exclusion_str = " ".join([f"#{_id}" for _id in merge_detector_ids])
-
-                for line in self.base_sections['cell'][1]:
-                    if air_cell_pattern.match(line):
-                        # 既存のコメントを維持しつつ、除外文字列を追加
-                        parts = line.split('$')
-                        main_part = parts[0].rstrip()
-                        comment_part = f" $ {parts[1].strip()}" if len(parts) > 1 else ""
-                        new_line = f"{main_part} {exclusion_str}{comment_part}"
-                        new_base_cell_lines.append(new_line)
-                    else:
-                        new_base_cell_lines.append(line)
-                
-                # Headerはそのままに、lineリストだけを更新
-                self.base_sections['cell'] = (self.base_sections['cell'][0], new_base_cell_lines)
-
-        except Exception as e:
-            # この処理でエラーが起きてもマージは続行する
-            import traceback
-            print(f"--- Warning: Failed to add detector exclusion to air cell. ---")
-            traceback.print_exc()
-            print(f"--- End Warning ---")
+        # ★例外処理で包まず、必要なセクションとIDが揃っている場合だけ処理する
+        # 1. マージされる検出器セルのIDを取得 (renumber後の新しいID)
+        #    セル行を走査し直さず、_update_references で最終的な行から集めたものを使う
+        merge_detector_ids = self._detector_ids
+
+        # 2. ベースのAirセル(ID:1000)の行を特定し、除外IDを追加
+        if merge_detector_ids and 'cell' in self.base_sections:
+            new_base_cell_lines = []
+            exclusion_str = " ".join([f"#{_id}" for _id in merge_detector_ids])
+
+            for line in self.base_sections['cell'][1]:
+                if _AIR_CELL_RE.match(line):
+                    # 既存のコメントを維持しつつ、除外文字列を追加
+                    parts = line.split('$')
+                    main_part = parts[0].rstrip()
+                    comment_part = f" $ {parts[1].strip()}" if len(parts) > 1 else ""
+                    new_line = f"{main_part} {exclusion_str}{comment_part}"
+                    new_base_cell_lines.append(new_line)
+                else:
+                    new_base_cell_lines.append(line)
+
+            # Headerはそのままに、lineリストだけを更新
+            self.base_sections['cell'] = (self.base_sections['cell'][0], new_base_cell_lines)
         # --- ここまでが新しいロジック ---
 
-        return self._render_output()
+        self._render_output(out)
 
     def _renumber_and_map_ids(self):
-        id_patterns = {
-            'mat': re.compile(r'^\s*mat\s*\[\s*(\d+)\s*\]', re.IGNORECASE),
-            'cell': re.compile(r'^\s*(\d+)\s+'),
-            'surf': re.compile(r'^\s*(\d+)\s+'),
-            'trans': re.compile(r'^\s*\*?Tr(\d+)', re.IGNORECASE)
-        }
-        section_keys = {'mat': 'material', 'cell': 'cell', 'surf': 'surface', 'trans': 'transform'}
-
-        for id_type, pattern in id_patterns.items():
-            key = section_keys[id_type]
-            base_ids = {int(m.group(1)) for sec_key, (_, lines) in self.base_sections.items() if sec_key.startswith(key) for line in lines for m in [pattern.match(line)] if m}
+        for id_type, (key, pattern) in _ID_TYPES.items():
+            base_ids = self._base_ids[id_type]
             
             max_base_id = max(base_ids) if base_ids else 0
             next_id = max_base_id + 1
@@ -313,43 +502,54 @@ class AdvancedPhitsMerger:
         if 'cell' not in self.merge_sections: return
 
         new_cell_lines = []
-        cell_line_pattern = re.compile(r'^\s*(\d+)\s+(-?\d+)\s+([^ ]+)\s+(.*)', re.IGNORECASE)
+        mat_map = self.id_maps['mat']
+        surf_map = self.id_maps['surf']
+        trans_map = self.id_maps['trans']
+        # ★行ごとのループで使うメソッドはローカル変数に取り出しておく
+        match_cell_line = _CELL_LINE_RE.match
+        sub_refs = _CELL_REFS_RE.sub
+
+        def replace_ref(m):
+            trcl_prefix, trans_id_str, trcl_suffix, sign, surf_id_str = m.groups()
+            if trcl_prefix is not None:
+                old_id = int(trans_id_str)
+                return f"{trcl_prefix}{trans_map.get(old_id, old_id)}{trcl_suffix}"
+            old_id = int(surf_id_str)
+            return f"{sign}{surf_map.get(old_id, old_id)}"
+
+        detector_ids = self._detector_ids
+
+        def add_line(line):
+            new_cell_lines.append(line)
+            # 検出器セル (trcl=1) のIDもこの走査で集める（"=1" を含まない行は正規表現を使わずに除外）
+            # 行は renumber・参照更新後のものなので、ここにあるIDが新しいID
+            if '=1' in line:
+                match = _DETECTOR_CELL_RE.match(line)
+                if match:
+                    detector_ids.append(int(match.group(1)))
 
         for line in self.merge_sections['cell'][1]:
-            match = cell_line_pattern.match(line)
+            match = match_cell_line(line)
             if not match:
-                new_cell_lines.append(line)
+                add_line(line)
                 continue
 
             cell_id_str, mat_id_str, density, rest_of_line = match.groups()
             mat_id = int(mat_id_str)
             
             # Material IDの参照更新
-            if abs(mat_id) in self.id_maps['mat']:
-                new_mat_id = self.id_maps['mat'][abs(mat_id)]
+            new_mat_id = mat_map.get(abs(mat_id))
+            if new_mat_id is not None:
                 mat_id_str = f'{"-" if mat_id < 0 else ""}{new_mat_id}'
 
-            # Surface IDの参照更新
-            def replace_surf(m):
-                prefix, old_id_str = m.group(1), m.group(2)
-                old_id = int(old_id_str)
-                new_id = self.id_maps['surf'].get(old_id, old_id)
-                return f"{prefix}{new_id}"
-            rest_of_line = re.sub(r'([+\-#])(\d+)', replace_surf, rest_of_line)
-
-            # Transform IDの参照更新
-            def replace_trans(m):
-                prefix, old_id_str, suffix = m.groups()
-                old_id = int(old_id_str)
-                new_id = self.id_maps['trans'].get(old_id, old_id)
-                return f"{prefix}{new_id}{suffix}"
-            rest_of_line = re.sub(r'(trcl\s*=\s*\(?\s*)(\d+)(\s*\)?)', replace_trans, rest_of_line, flags=re.IGNORECASE)
-
-            new_cell_lines.append(f"  {cell_id_str} {mat_id_str} {density} {rest_of_line}")
+            # Surface / Transform IDの参照更新（1回の置換でまとめて処理）
+            rest_of_line = sub_refs(replace_ref, rest_of_line)
+
+            add_line(f"  {cell_id_str} {mat_id_str} {density} {rest_of_line}")
         
         self.merge_sections['cell'] = (self.merge_sections['cell'][0], new_cell_lines)
 
-    def _render_output(self):
+    def _render_output(self, out):
         final_sections = self.base_sections.copy()
 
         for key, (header, lines) in self.merge_sections.items():
@@ -358,34 +558,107 @@ class AdvancedPhitsMerger:
             elif key in self.overwrite_keys:
                 final_sections[key] = (header, lines)
             elif key in self.merge_keys:
-                if key == 'cell':
-                    # セルの場合は、マージ(テンプレート)側を先に書き込むことで優先させる
-                    if key in final_sections:
-                        final_sections[key][1][:] = lines + final_sections[key][1]
+                if key in final_sections:
+                    # ベース側の行リストは書き換えず、連結したリストも作らずに
+                    # 出力時に両方を順に読むだけにする（各セクションは1回だけ出力される）
+                    base_header, base_lines = final_sections[key]
+                    if key == 'cell':
+                        # セルの場合は、マージ(テンプレート)側を先に書き込むことで優先させる
+                        merged = itertools.chain(lines, base_lines)
                     else:
-                        final_sections[key] = (header, lines)
-                elif key in final_sections:
-                    final_sections[key][1].extend(lines)
+                        merged = itertools.chain(base_lines, lines)
+                    final_sections[key] = (base_header, merged)
                 else:
                     final_sections[key] = (header, lines)
             elif key not in final_sections:
                 final_sections[key] = (header, lines)
 
         order = ['title', 'parameters', 'material', 'surface', 'cell', 'volume', 'transform', 'source', 'tdeposit', 'tend']
-        output_lines = []
-        written_keys = set()
-
+        # 各キーを、最初に一致する出力順のプレフィックスへ1回の走査で振り分ける
+        keys_by_prefix = {key_prefix: [] for key_prefix in order}
+        for key in final_sections:
+            for key_prefix in order:
+                if key.startswith(key_prefix):
+                    keys_by_prefix[key_prefix].append(key)
+                    break
+
+        # ★出力行のリストを作って "\n".join せず、ストリームへ順に書き込む
+        #   （セクションの間は空行1つで区切り、結果は従来の join と同じになる）
+        write = out.write
+        first = True
         for key_prefix in order:
-            keys_to_write = sorted([k for k in final_sections if k.startswith(key_prefix)])
-            for key in keys_to_write:
-                if key not in written_keys:
-                    header, lines = final_sections[key]
-                    output_lines.append(header)
-                    output_lines.extend(l for l in lines if l.strip())
-                    output_lines.append('')
-                    written_keys.add(key)
-        
-        return "\n".join(output_lines)
+            for key in sorted(keys_by_prefix[key_prefix]):
+                header, lines = final_sections[key]
+                if not first:
+                    write("\n")
+                first = False
+                write(header)
+                write("\n")
+                for l in lines:
+                    if l.strip():
+                        write(l)
+                        write("\n")
+
+
+@functools.lru_cache(maxsize=4)
+def _load_template(path, mtime):
+    """
+    テンプレートファイルを読み込む。
+    パスと更新時刻をキーに結果をキャッシュするため、ファイルが編集された場合だけ読み直す。
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+@functools.lru_cache(maxsize=4)
+def _load_environment(path, mtime):
+    """
+    環境定義ファイルを読み込み、(最大のセルID, ベース側だけを解析した結合器) を返す。
+    テンプレートと同様に、パスと更新時刻をキーに解析結果をキャッシュする。
+    返す結合器は merge_with でだけ使い、merge() は呼ばないこと（ベース側が書き換わるため）。
+    """
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        env_text = f.read()
+
+    # 環境ファイル内の最大のセルIDを探す
+    max_env_cell_id = 0
+    for line in env_text.splitlines():
+        # 数字で始まらない行（コメント行など）は正規表現を使わずに除外
+        if not line.lstrip()[:1].isdigit():
+            continue
+        match = _CELL_ID_RE.match(line)
+        if match:
+            max_env_cell_id = max(max_env_cell_id, int(match.group(1)))
+
+    # 環境ファイルの解析は全評価点で共通のため、ベース側だけの結合器として1回だけ行う
+    return max_env_cell_id, AdvancedPhitsMerger(env_text)
+
+
+def _init_point_worker(base_merger):
+    """
+    プロセスプールの各ワーカーの初期化。
+    全評価点で共通の環境ファイルの解析結果を、ジョブごとではなくワーカーごとに1回だけ受け取る。
+    """
+    global _worker_env
+    _worker_env = base_merger
+
+
+def _generate_one_point(job):
+    """
+    プロセスプールから呼ばれ、1つの評価点 (テンプレート, 出力先) の入力ファイルを書き出す。
+    環境ファイルの解析結果は _init_point_worker で受け取ったものを使う。
+    """
+    return _write_point(_worker_env, *job)
+
+
+def _write_point(base_merger, filled_template, out_name):
+    """
+    1つの評価点について、環境ファイルとテンプレートをマージした入力ファイルを書き出す。
+    """
+    # マージ結果は文字列にまとめず、ファイルへ直接書き込む（改行コードはテキストモードで変換される）
+    with open(out_name, 'w', encoding='utf-8', buffering=1 << 16) as f:
+        base_merger.merge_with(filled_template, f)
+    return out_name
 
 
 def generate_detailed_simulation_files(routes, output_dir, default_maxcas=None, default_maxbch=None):
@@ -393,8 +666,9 @@ def generate_detailed_simulation_files(routes, output_dir, default_maxcas=None,
     AdvancedPhitsMergerを使用して、経路上の各評価点に対するPHITS入力ファイルを生成する。
     """
     try:
-        with open(os.path.join(os.path.dirname(__file__), 'template.inp'), 'r', encoding='utf-8') as f:
-            template_text = f.read()
+        template_text = _load_template(_TEMPLATE_PATH, os.path.getmtime(_TEMPLATE_PATH))
+        # テンプレートを「固定部分, プレースホルダ名, 固定部分, ...」に1回だけ分割しておく
+        template_parts = _PLACEHOLDER_RE.split(template_text)
     except Exception as e:
         messagebox.showerror("テンプレート読み込み失敗", f"template.inpの読み込みに失敗: {e}")
         return False, 0
@@ -407,34 +681,27 @@ def generate_detailed_simulation_files(routes, output_dir, default_maxcas=None,
         return False, 0 # キャンセルされた
         
     try:
-        with open(env_path, 'r', encoding='utf-8', errors='ignore') as f:
-            env_text = f.read()
+        # ★ 同じ環境ファイルで繰り返し実行する場合は、前回の解析結果を再利用する
+        max_env_cell_id, env_merger = _load_environment(
+            env_path, os.path.getmtime(env_path))
     except Exception as e:
         messagebox.showerror('読込失敗', f'環境定義ファイルの読み込みに失敗: {e}')
         return False, 0
 
     # --- 検出器のセルIDを動的に決定 ---
-    # 環境ファイル内の最大のセルIDを探す
-    cell_id_pattern = re.compile(r'^\s*(\d+)\s+\d+')
-    max_env_cell_id = 0
-    for line in env_text.splitlines():
-        # コメント行は除外
-        if line.strip().startswith('$'):
-            continue
-        match = cell_id_pattern.match(line)
-        if match:
-            max_env_cell_id = max(max_env_cell_id, int(match.group(1)))
-    
     # 衝突しないように、十分大きなIDを開始点とするのも良い
     # ここでは単純に最大値+1とする
     detector_cell_id_start = max_env_cell_id + 1
     # --- ID決定ここまで ---
 
     file_count = 0
+    jobs = []
     try:
         for ri, route in enumerate(routes, start=1):
             route_dir = os.path.join(output_dir, f"route_{ri}")
             os.makedirs(route_dir, exist_ok=True)
+            # ★ 評価点ごとに Path を組み立てず、経路ごとのファイル名の接頭辞に番号を付けるだけにする
+            out_prefix = os.path.join(route_dir, "detailed_point_")
 
             # この経路で使用する検出器IDを決定（基本は同じだが、将来的な拡張のため）
             detector_cell_id = detector_cell_id_start 
@@ -442,31 +709,40 @@ def generate_detailed_simulation_files(routes, output_dir, default_maxcas=None,
             for idx, pt in enumerate(route.get('detailed_path', []), start=1):
                 det_x, det_y, det_z = pt
                 
-                filled_template = template_text
                 # 詳細評価ダイアログで入力された値を最優先し、それが無ければルート固有の値、さらに無ければ既定値(10000)を使う
                 maxcas_val = default_maxcas if default_maxcas is not None else route.get('maxcas', 10000)
                 maxbch_val = default_maxbch if default_maxbch is not None else route.get('maxbch', 10)
 
                 replacements = {
-                    '{det_x}': f"{det_x:.3f}",
-                    '{det_y}': f"{det_y:.3f}",
-                    '{det_z}': f"{det_z:.3f}",
-                    '{nuclide_name}': route.get('nuclide', 'Cs-137'),
-                    '{activity_value}': route.get('activity', '1.0E+12'),
-                    '{maxcas_value}': str(int(maxcas_val)),
-                    '{maxbch_value}': str(int(maxbch_val)),
-                    '{detector_cell_id}': str(detector_cell_id), # 動的に決定したIDを適用
+                    'det_x': f"{det_x:.3f}",
+                    'det_y': f"{det_y:.3f}",
+                    'det_z': f"{det_z:.3f}",
+                    'nuclide_name': route.get('nuclide', 'Cs-137'),
+                    'activity_value': route.get('activity', '1.0E+12'),
+                    'maxcas_value': str(int(maxcas_val)),
+                    'maxbch_value': str(int(maxbch_val)),
+                    'detector_cell_id': str(detector_cell_id), # 動的に決定したIDを適用
                 }
-                for key, val in replacements.items():
-                    filled_template = filled_template.replace(key, val)
-
-                merger = AdvancedPhitsMerger(base_content=env_text, merge_content=filled_template)
-                final_content = merger.merge()
-
-                out_name = os.path.join(route_dir, f"detailed_point_{idx:03d}.inp")
-                with open(out_name, 'w', encoding='utf-8') as f:
-                    f.write(final_content)
-
+                # 固定部分はそのまま使い、プレースホルダの位置だけ値に差し替えて連結する
+                pieces = template_parts[:]
+                for i in range(1, len(pieces), 2):
+                    pieces[i] = replacements[pieces[i]]
+                filled_template = "".join(pieces)
+
+                out_name = f"{out_prefix}{idx:03d}.inp"
+                jobs.append((filled_template, out_name))
+
+        # 各評価点は互いに独立なため、点数が多い場合はプロセスプールで並列に生成する
+        # （プロセス起動のコストがあるため、少数の場合は逐次処理）
+        # ワーカー数は既定値に任せる（Windows では 61 を超えると ValueError になるため、既定値はそこで頭打ちになる）
+        if len(jobs) >= _PARALLEL_MIN_POINTS:
+            with ProcessPoolExecutor(initializer=_init_point_worker,
+                                     initargs=(env_merger,)) as executor:
+                for _ in executor.map(_generate_one_point, jobs, chunksize=16):
+                    file_count += 1
+        else:
+            for filled_template, out_name in jobs:
+                _write_point(env_merger, filled_template, out_name)
                 file_count += 1
 
         if file_count > 0:
@@ -475,14 +751,56 @@ def generate_detailed_simulation_files(routes, output_dir, default_maxcas=None,
 
     except Exception as e:
         messagebox.showerror('生成失敗', f'詳細入力ファイルの生成中に予期せぬエラーが発生しました: {e}')
-        import traceback
         traceback.print_exc()
         return False, 0
 
+def _mmap_file(f):
+    """ファイル全体を読み取り専用でメモリマップする。空ファイルは mmap できないため None を返す"""
+    if os.fstat(f.fileno()).st_size == 0:
+        return None
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _select_numeric_block(lines, expected_count):
+    """
+    バイト列の行を順に読み、ヘッダを避けた連続した「数値行ブロック」ごとに数値を集め、
+    期待数以上で超過が最も少ないブロック（無ければ最も数の多いブロック）の数値トークンを返す。
+    ブロックは閉じた時点で判定し、行そのものは保持しない。
+    数値はバイト列のまま数え、float への変換は呼び出し側で採用したブロックだけに行う。
+    """
+    best_nums = []      # 期待数以上で、超過が最も少ないブロック
+    best_diff = None
+    largest_nums = []   # 期待数を満たすブロックが無い場合に使う、最も数の多いブロック
+    current_nums = []
+    # 末尾に区切り用の空行を足し、最後のブロックもループ内で判定する
+    for line in itertools.chain(lines, [b""]):
+        s = line.strip()
+        if s and b":" not in s and not s.startswith(b"#") and b"=" not in s \
+                and not _DIGIT_BYTES.isdisjoint(s):
+            # この行は数値を含む可能性あり -> ブロックに追加
+            current_nums.extend(_NUM_RE.findall(s))
+            continue
+
+        # 区切り行: 直前のブロックを判定
+        if current_nums:
+            if len(current_nums) >= expected_count:
+                diff = len(current_nums) - expected_count
+                if best_diff is None or diff < best_diff:
+                    best_diff = diff
+                    best_nums = current_nums
+            if len(current_nums) > len(largest_nums):
+                largest_nums = current_nums
+            current_nums = []
+            # 期待数ちょうどのブロックより良いものは無いので打ち切る
+            if best_diff == 0:
+                break
+
+    # 期待数を満たすブロックが無ければ、最も多くの数を持つブロックを選ぶ
+    return best_nums if best_nums else largest_nums
+
 def load_and_parse_dose_map():
     """
     ファイル選択ダイアログを開き、PHITSの出力ファイル(deposit.out)を読み込んで、
-    線量マップデータを返す。
+    線量マップデータ (MAP_ROWS×MAP_COLS の float64 配列) を返す。
     """
     filepath = filedialog.askopenfilename(
         title="PHITS出力ファイル (deposit.out) を選択",
@@ -490,103 +808,45 @@ def load_and_parse_dose_map():
     )
     if not filepath: return None
 
-    dose_map = [[0.0 for _ in range(MAP_COLS)] for _ in range(MAP_ROWS)]
-    
     try:
-        with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-            lines = f.readlines()
-
         expected_count = MAP_ROWS * MAP_COLS
 
-        # 1) ヘッダを避け、連続した「数値行ブロック」を探す
-        groups = []
-        current = []
-        for line in lines:
-            s = line.strip()
-            if not s or ":" in s or s.startswith("#") or "=" in s:
-                if current:
-                    groups.append(current)
-                    current = []
-                continue
-            if not any(c.isdigit() for c in s):
-                if current:
-                    groups.append(current)
-                    current = []
-                continue
-            # この行は数値を含む可能性あり -> グループに追加
-            current.append(s)
-        if current:
-            groups.append(current)
-
-        # 2) 各グループから数値を抽出し、期待数を満たすブロックを選択
+        # ★ファイルはメモリマップして読み込み、行ごとの読み出しと最終手段の全体検索の両方に使う
+        #   PHITSの出力はASCIIのため、デコードせずバイト列のまま判定・抽出する
         best_nums = []
-        best_diff = None
-        for grp in groups:
-            nums = []
-            for ln in grp:
-                parts = re.split(r"\s+", ln)
-                for tok in parts:
-                    try:
-                        nums.append(float(tok))
-                    except ValueError:
-                        continue
-            if not nums:
-                continue
-            if len(nums) >= expected_count:
-                diff = len(nums) - expected_count
-                if best_diff is None or diff < best_diff:
-                    best_diff = diff
-                    best_nums = nums
-        # 3) 期待数を満たすグループが無ければ、最も多くの数を持つグループを選ぶ
-        if not best_nums and groups:
-            # find group with max numeric tokens
-            max_cnt = 0
-            for grp in groups:
-                nums = []
-                for ln in grp:
-                    parts = re.split(r"\s+", ln)
-                    for tok in parts:
-                        try:
-                            nums.append(float(tok))
-                        except ValueError:
-                            continue
-                if len(nums) > max_cnt:
-                    max_cnt = len(nums)
-                    best_nums = nums
-
-        # fallback: 全体から抽出 (最終手段)
-        if not best_nums:
-            all_text = "".join(lines)
-            num_pattern = r"[-+]?\d*\.\d+(?:[eE][-+]?\d+)?|[-+]?\d+(?:[eE][-+]?\d+)?"
-            raw_numbers = re.findall(num_pattern, all_text)
-            best_nums = []
-            for tok in raw_numbers:
-                try:
-                    best_nums.append(float(tok))
-                except ValueError:
-                    continue
+        with open(filepath, 'rb') as f:
+            mm = _mmap_file(f)
+            if mm is not None:
+                with mm:
+                    best_nums = _select_numeric_block(iter(mm.readline, b""), expected_count)
+                    # fallback: 全体から抽出 (最終手段)
+                    if not best_nums:
+                        best_nums = _NUM_RE.findall(mm)
+
+        values = np.asarray(best_nums, dtype=np.float64)
 
         # デバッグ出力: 選択した数値列を保存
         input_dir = os.path.dirname(filepath)
         raw_path = os.path.join(input_dir, "debug_raw_values.txt")
         try:
-            with open(raw_path, "w", encoding='utf-8') as f_debug:
-                f_debug.write(f"Total found: {len(best_nums)}\nNeeded: {expected_count}\n")
-                for idx, val in enumerate(best_nums):
-                    f_debug.write(f"[{idx}] {val}\n")
+            # ★ 1行ずつ書かず np.savetxt でまとめて書き出す
+            np.savetxt(
+                raw_path,
+                np.column_stack((np.arange(len(values)), values)),
+                fmt="[%d] %.15g",
+                header=f"Total found: {len(values)}\nNeeded: {expected_count}",
+                comments='',
+                encoding='utf-8',
+            )
         except Exception:
             pass
 
-        if len(best_nums) < expected_count:
+        if len(values) < expected_count:
             messagebox.showwarning("データ不足", f"出力ファイルから十分な数のデータを読み込めませんでした。詳細は {raw_path} を確認してください。")
             return None
 
-        relevant_data = best_nums[:expected_count]
-        idx = 0
-        for r in range(MAP_ROWS):
-            for c in range(MAP_COLS):
-                dose_map[r][c] = relevant_data[idx]
-                idx += 1
+        # 先頭の期待数だけを (行, 列) の配列に一括で整形する
+        dose_map = values[:expected_count].reshape(MAP_ROWS, MAP_COLS)
         
         messagebox.showinfo("読込成功", "線量マップを正常に読み込みました。")
         return dose_map
@@ -595,14 +855,50 @@ def load_and_parse_dose_map():
         messagebox.showerror("読み込みエラー", f"{e}")
         return None
 
-def execute_phits_simulation(inp_path, phits_command="phits.bat", expected_output="deposit.out"):
+def _read_log_tail(path, max_bytes=_LOG_TAIL_BYTES):
+    """ログファイルの末尾 max_bytes バイトだけを読み込んで文字列として返す"""
+    try:
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            if size > max_bytes:
+                f.seek(size - max_bytes)
+            data = f.read()
+    except OSError:
+        return ""
+    text = data.decode('utf-8', errors='ignore')
+    if size > max_bytes:
+        text = f"...（先頭を省略: 全文は {path}）\n" + text
+    return text
+
+def _kill_process_tree(process):
+    """
+    PHITSのプロセスを子プロセスごと終了させる。
+    phits.bat 経由の実行では本体が子プロセスのため、起動したプロセスだけを kill すると
+    本体が標準出力を開いたまま残り、読み取りが終わらない。
+    """
+    if process.poll() is not None:
+        return
+    try:
+        if os.name == 'nt':
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        process.kill()
+
+def execute_phits_simulation(inp_path, phits_command="phits.bat", expected_output="deposit.out", cancel_event=None):
     """
     指定された.inpファイルでPHITSシミュレーションを実行する。
     1021.pyを参考に、より堅牢な実行方法を採用。
+    cancel_event (threading.Event) が指定され、それがセットされた場合は実行中のPHITSを終了させて失敗として返す。
     """
     base_name = os.path.splitext(os.path.basename(inp_path))[0]
     run_dir = os.path.join(os.path.dirname(inp_path), f"run_{base_name}")
     
+    if cancel_event is not None and cancel_event.is_set():
+        return False, f"PHITS実行は取り消されました ({base_name})"
+
     try:
         os.makedirs(run_dir, exist_ok=True)
         shutil.copy(inp_path, os.path.join(run_dir, "input.inp"))
@@ -611,25 +907,71 @@ def execute_phits_simulation(inp_path, phits_command="phits.bat", expected_outpu
         # shell=Falseで実行するため、cdは使えない。cwdでディレクトリを指定する。
         command_parts = [phits_command, "input.inp"]
 
-        process = subprocess.Popen(
-            command_parts,
-            cwd=run_dir,  # 実行ディレクトリを指定
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            encoding='utf-8',
-            errors='ignore'
-        )
-        stdout, stderr = process.communicate(timeout=600)
-
-        # ログにすべての出力を記録
+        # ★標準出力は1行ずつ読みながら stdout.log へ書き出し（出力全体をメモリに溜めない）、
+        #   致命的エラーの出力を見つけた時点でプロセスを終了させる。標準エラーはファイルへ直接書き出す
+        stdout_path = os.path.join(run_dir, "stdout.log")
+        stderr_path = os.path.join(run_dir, "stderr.log")
+        fatal_line = None
+        with open(stdout_path, 'wb') as out, open(stderr_path, 'wb') as err:
+            process = subprocess.Popen(
+                command_parts,
+                cwd=run_dir,  # 実行ディレクトリを指定
+                stdout=subprocess.PIPE,
+                stderr=err,
+                start_new_session=(os.name != 'nt'),
+            )
+            # 出力が止まったままでも制限時間で打ち切れるよう、読み取りとは別にタイマーで監視する
+            timed_out = threading.Event()
+
+            def on_timeout():
+                timed_out.set()
+                _kill_process_tree(process)
+
+            watchdog = threading.Timer(_PHITS_TIMEOUT_SEC, on_timeout)
+            watchdog.start()
+
+            # 取り消しが指示されたら、プロセスの終了を待たずに子プロセスごと終了させる
+            cancelled = threading.Event()
+            if cancel_event is not None:
+                def watch_cancel():
+                    while process.poll() is None:
+                        if cancel_event.wait(0.5):
+                            cancelled.set()
+                            _kill_process_tree(process)
+                            return
+
+                threading.Thread(target=watch_cancel, daemon=True).start()
+            try:
+                for line in process.stdout:
+                    out.write(line)
+                    if _FATAL_RE.search(line):
+                        fatal_line = line.decode('utf-8', errors='ignore').strip()
+                        _kill_process_tree(process)
+                        break
+            except BaseException:
+                _kill_process_tree(process)
+                raise
+            finally:
+                watchdog.cancel()
+                process.stdout.close()
+                process.wait()
+
+        if cancelled.is_set():
+            return False, f"PHITS実行は取り消されました ({base_name})"
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(command_parts, _PHITS_TIMEOUT_SEC)
+
+        # ログには各出力の末尾だけを記録（全文は stdout.log / stderr.log を参照）
         log_message = (
             f"--- PHITS Log for {base_name} ---\n"
             f"Return Code: {process.returncode}\n"
-            f"[STDOUT]:\n{stdout}\n"
-            f"[STDERR]:\n{stderr}\n"
+            f"[STDOUT]:\n{_read_log_tail(stdout_path)}\n"
+            f"[STDERR]:\n{_read_log_tail(stderr_path)}\n"
             f"--- End Log ---\n"
         )
+
+        if fatal_line is not None:
+            return False, f"PHITSが致命的エラーを出力したため実行を中断しました: {fatal_line}\n{log_message}"
         
         # 結果ファイルの存在確認
         deposit_path = os.path.join(run_dir, expected_output)
@@ -653,6 +995,30 @@ def execute_phits_simulation(inp_path, phits_command="phits.bat", expected_outpu
     except Exception as e:
         return False, f"PHITS実行中に予期せぬエラーが発生しました ({base_name}): {e}"
 
+def execute_phits_batch(inp_paths, phits_command="phits.bat", max_workers=None, expected_output="deposit.out"):
+    """
+    複数の.inpファイルでPHITSを並列に実行し、入力順に (inp_path, success, result) を返すイテレータ。
+    各実行は別々の run_* フォルダで行われるため互いに干渉しない。PHITSはシングルスレッドのため、
+    既定では CPU コア数の半分の実行を同時に走らせる（待ち合わせはスレッドで行う）。
+    途中で反復をやめた場合（最初のエラーで呼び出し元が return した場合など）、まだ開始していない実行は取り消し、
+    実行中のPHITSは子プロセスごと終了させてから戻る（PHITSのプロセスを残したままにしない）。
+    """
+    inp_paths = list(inp_paths)
+    if max_workers is None:
+        max_workers = max(1, (os.cpu_count() or 2) // 2)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    cancel_event = threading.Event()
+    try:
+        futures = [executor.submit(execute_phits_simulation, inp_path, phits_command, expected_output, cancel_event)
+                   for inp_path in inp_paths]
+        for inp_path, future in zip(inp_paths, futures):
+            success, result = future.result()
+            yield inp_path, success, result
+    finally:
+        # 実行中のPHITSを終了させてから、それらのスレッドが戻るのを待つ（すぐに終わる）
+        cancel_event.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
 def calculate_total_dose(doses):
     """
     線量リストを受け取り、合計線量を計算して返す。
@@ -662,6 +1028,48 @@ def calculate_total_dose(doses):
     return sum(doses)
 
 
+def _is_reg_table_header(line):
+    """mesh=reg の結果テーブルのヘッダー行 (例: "#  num   reg    volume     all       r.err") かどうか"""
+    return line.startswith(b'#') and all(kw in line for kw in _REG_TABLE_HEADER_KEYWORDS)
+
+
+def _find_reg_table_dose(data):
+    """
+    mesh=reg の結果テーブルから 'all' 列 (4列目) の値を返す。テーブルが無い・読めない場合は None。
+    ヘッダー行はコメント行だけを正規表現で拾って判定し、データ行はヘッダーの後ろだけを切り出す。
+    """
+    for m in _COMMENT_LINE_RE.finditer(data):
+        if _is_reg_table_header(m.group().strip()):
+            pos = m.end()
+            break
+    else:
+        return None
+
+    # ヘッダーの次の行がデータのはず（ヘッダーが続く場合は読み飛ばす）
+    while pos < len(data):
+        start = pos + 1
+        end = data.find(b'\n', start)
+        if end < 0:
+            end = len(data)
+        normalized_line = data[start:end].strip()
+        pos = end
+        if _is_reg_table_header(normalized_line):
+            continue
+        # データ行はコメントではない
+        if normalized_line.startswith(b'#'):
+            return None
+        parts = normalized_line.split()
+        if len(parts) >= 4:
+            try:
+                # 4列目が 'all' (total dose) の値
+                return float(parts[3])
+            except ValueError:
+                # データ行の形式が予期せぬものだった場合はフォールバックへ
+                return None
+        return None
+    return None
+
+
 def extract_dose_from_deposit(run_dir):
     """
     実行ディレクトリ内の deposit.out から線量データを抽出し、
@@ -674,65 +1082,73 @@ def extract_dose_from_deposit(run_dir):
     if not os.path.exists(deposit_file):
         return None, f"deposit.out が見つかりません: {deposit_file}"
 
-    lines = []
+    # ★ファイルはバイト列のまま扱い、行全体のデコードはエラー表示用のプレビューだけに行う
+    #   （数値の変換は float() がバイト列をそのまま受け付ける）
+    reg_table_checked = False
     try:
-        with open(deposit_file, 'r', encoding='utf-8', errors='ignore') as f:
-            lines = f.readlines()
+        with open(deposit_file, 'rb') as f:
+            mm = _mmap_file(f)
+            if mm is None:
+                data = b""
+            else:
+                with mm:
+                    # ★改行コードが '\n' だけの場合は、ファイルを読み込まずにメモリマップ上で
+                    #   mesh=reg の結果テーブルを探す（ほとんどの出力はここで終わる）
+                    if mm.find(b'\r') < 0:
+                        dose_val = _find_reg_table_dose(mm)
+                        if dose_val is not None:
+                            return [dose_val], None # ★★★ 成功 ★★★
+                        reg_table_checked = True
+                    data = mm[:]
+        # テキストモードと同様に改行コードを '\n' に揃える
+        data = data.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
     except Exception as e:
         return None, f"deposit.out の読み込み中にエラーが発生しました: {e}"
 
+    def preview(chunk):
+        return b"".join(chunk).decode('utf-8', errors='ignore')
+
+    lines = None
     try:
         # --- 新・最終戦略: mesh=reg の結果テーブルを正確にパース ---
-        data_header_found = False
-        for line in lines:
-            normalized_line = line.strip()
-            # ヘッダー行を探す (例: "#  num   reg    volume     all       r.err")
-            if normalized_line.startswith('#') and all(kw in normalized_line for kw in ['num', 'reg', 'volume', 'all']):
-                data_header_found = True
-                continue  # データは次の行にある
-
-            # ヘッダーが直前の行で見つかっていたら、この行がデータのはず
-            if data_header_found:
-                # データ行はコメントではない
-                if not normalized_line.startswith('#'):
-                    parts = normalized_line.split()
-                    if len(parts) >= 4:
-                        try:
-                            # 4列目が 'all' (total dose) の値
-                            dose_val = float(parts[3])
-                            return [dose_val], None # ★★★ 成功 ★★★
-                        except (ValueError, IndexError):
-                            # データ行の形式が予期せぬものだった場合、ループを抜けてフォールバックへ
-                            break 
-                # データ行でなかった場合、この戦略は終了してフォールバックへ
-                break
-        
+        # ★ファイル全体を行に分割せず、コメント行だけを正規表現で探してヘッダー行を見つけ、
+        #   その直後の行だけを切り出して読む
+        dose_val = None if reg_table_checked else _find_reg_table_dose(data)
+        if dose_val is not None:
+            return [dose_val], None # ★★★ 成功 ★★★
+
+        # フォールバックでは行単位で走査する
+        lines = data.splitlines(keepends=True)
+
         # --- フォールバック戦略1: 'total' サマリ行を探す ---
         for line in reversed(lines):
-            if line.strip().lower().startswith('total'):
-                parts = line.strip().split()
-                if len(parts) >= 2 and re.match(r'^[+-]?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?$', parts[1]):
-                    return [float(parts[1])], None
+            # 先頭5文字で先に絞り込み、該当する行だけを分割する
+            stripped = line.lstrip()
+            if stripped[:5].lower() != b'total':
+                continue
+            parts = stripped.split()
+            if len(parts) >= 2 and _FLOAT_TOKEN_RE.match(parts[1]):
+                return [float(parts[1])], None
 
         # --- フォールバック戦略2: 環境マップ形式 (z(cm)ヘッダー) ---
         doses = []
         data_started = False
         for line in lines:
-            if "z(cm)" in line and "total" in line:
+            if b"z(cm)" in line and b"total" in line:
                 data_started = True
                 continue
             if not data_started: continue
             
-            parts = line.strip().split()
-            if len(parts) >= 4 and re.match(r'^[+-]?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?$', parts[3]):
+            parts = line.split()
+            if len(parts) >= 4 and _FLOAT_TOKEN_RE.match(parts[3]):
                 doses.append(float(parts[3]))
         
         if doses:
             return doses, None
 
         # --- 全ての戦略で失敗した場合 ---
-        file_content_preview_first = "".join(lines[:30])
-        file_content_preview_last = "".join(lines[-30:])
+        file_content_preview_first = preview(lines[:30])
+        file_content_preview_last = preview(lines[-30:])
         error_msg = (
             "deposit.out 内に有効な線量データが見つかりませんでした。\n"
             f"--- File Content Preview (first 30 lines) ---\n{file_content_preview_first}\n"
@@ -741,8 +1157,9 @@ def extract_dose_from_deposit(run_dir):
         return None, error_msg
 
     except Exception as e:
-        import traceback
-        file_content_preview = "".join(lines[:50])
+        if lines is None:
+            lines = data.splitlines(keepends=True)
+        file_content_preview = preview(lines[:50])
         error_msg = (
             f"deposit.out の解析中に予期せぬエラーが発生しました: {e}\n"
             f"{traceback.format_exc()}\n"
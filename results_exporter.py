@@ -6,36 +6,39 @@
 
 import csv
 import io
+from itertools import repeat
 
-def generate_results_csv(results, routes):
+def iter_results_csv_rows(results, routes):
     """
-    シミュレーション結果と経路情報を受け取り、CSV形式の文字列を生成する。
+    シミュレーション結果と経路情報を受け取り、CSVの行 (ヘッダー行を含む) を順に返す。
+    CSV全体を文字列にまとめずに、呼び出し側で csv.writer へ直接流し込むために使う。
 
     Args:
         results (dict): シミュレーション結果の辞書。
                         キーは 'route_1', 'route_2' など。
         routes (list): アプリケーションが管理する経路情報のリスト。
 
-    Returns:
-        str: CSV形式のデータ文字列。
+    Yields:
+        list or tuple: CSVの1行分の値。
     """
-    output = io.StringIO()
-    writer = csv.writer(output)
+    # 数値の書式化はループ内で f-string を組み立てず、メソッドを1回だけ取り出して使う
+    fmt_distance = "{:.2f}".format
+    fmt_dose = "{:.6e}".format
 
-    # --- ヘッダー行を書き込み ---
-    writer.writerow([
+    # --- ヘッダー行 ---
+    yield [
         "Route Name",
         "Route Color",
         "Point Index",
         "Distance (cm)",
         "Dose (Gy/source)"
-    ])
+    ]
 
-    # --- データ行を書き込み ---
+    # --- データ行 ---
     # 結果をルート名でソートして処理
     for route_name, result_data in sorted(results.items()):
         doses = result_data.get("doses", [])
-        
+
         # 'route_1' のような名前からインデックス (0) を取得
         try:
             route_index = int(route_name.split('_')[-1]) - 1
@@ -50,15 +53,37 @@ def generate_results_csv(results, routes):
         if not doses:
             continue
 
-        # 各評価点のデータを出力
-        for i, dose in enumerate(doses):
-            distance = i * step_width
-            writer.writerow([
-                route_name,
-                route_color,
-                i + 1,
-                f"{distance:.2f}",
-                f"{dose:.6e}"
-            ])
+        # ★各評価点の行は経路ごとにまとめて返す（writerows へそのまま渡せる）
+        n = len(doses)
+        yield from zip(
+            repeat(route_name, n),
+            repeat(route_color, n),
+            range(1, n + 1),
+            map(fmt_distance, (i * step_width for i in range(n))),
+            map(fmt_dose, doses),
+        )
+
+
+def write_results_csv(f, results, routes):
+    """
+    シミュレーション結果をCSV形式で、ファイルなどのテキストストリーム f へ直接書き込む。
+    f は newline='' で開いておくこと。
+    """
+    csv.writer(f).writerows(iter_results_csv_rows(results, routes))
+
+
+def generate_results_csv(results, routes):
+    """
+    シミュレーション結果と経路情報を受け取り、CSV形式の文字列を生成する。
+
+    Args:
+        results (dict): シミュレーション結果の辞書。
+                        キーは 'route_1', 'route_2' など。
+        routes (list): アプリケーションが管理する経路情報のリスト。
 
+    Returns:
+        str: CSV形式のデータ文字列。
+    """
+    output = io.StringIO()
+    write_results_csv(output, results, routes)
     return output.getvalue()
@@ -4,10 +4,31 @@
 A*アルゴリズムを含む、経路計算関連のロジックを格納するモジュール。
 """
 
+import functools
 import heapq
 import math
+import numpy as np
 from app_config import MAP_ROWS, MAP_COLS
 
+def _build_neighbors(rows, cols):
+    """
+    各マス (r*cols+c) について、マップ範囲内の上下左右の隣接マスを
+    (隣接マスの番号, 行, 列) のタプルで、上・下・左・右の順に並べた表を作る。
+    """
+    neighbors = []
+    for r in range(rows):
+        for c in range(cols):
+            cell = []
+            for dr, dc in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+                nr, nc = r + dr, c + dc
+                if 0 <= nr < rows and 0 <= nc < cols:
+                    cell.append((nr * cols + nc, nr, nc))
+            neighbors.append(tuple(cell))
+    return tuple(neighbors)
+
+# ★A*の展開のたびに方向のリストを作って範囲チェックをしないよう、隣接マスの表を1回だけ作る
+_NEIGHBORS = _build_neighbors(MAP_ROWS, MAP_COLS)
+
 def find_optimal_route(start_pos, goal_pos, middle_pos, map_data, dose_map, weight):
     """
     スタート -> (中継点) -> ゴール までの最適経路を探索する。
@@ -18,26 +39,45 @@ def find_optimal_route(start_pos, goal_pos, middle_pos, map_data, dose_map, weig
         goal_pos (tuple): ゴール地点の (row, col)
         middle_pos (tuple or None): 中継地点の (row, col)。なければ None。
         map_data (list[list[int]]): マップの内部データ (壁情報など)
-        dose_map (list[list[float]]): 各マスの線量データ
+        dose_map (numpy.ndarray or list[list[float]]): 各マスの線量データ
         weight (float): 線量コストに対する重み係数
 
     Returns:
         list or None: 見つかった経路の座標リスト。見つからなければ None。
     """
-    full_path = []
-    
+    # ★マップ・線量・端点・重みが同じなら結果も同じため、内容のバイト列をキーに探索結果をキャッシュする
+    #   （GUIでは同じ条件で経路を何度も計算し直すことが多い）
+    map_key = np.asarray(map_data, dtype=np.int64).tobytes()
+    if dose_map is None:
+        dose_key = None
+    else:
+        dose_key = np.asarray(dose_map, dtype=np.float64).tobytes()
+    path = _find_optimal_route_cached(
+        tuple(start_pos), tuple(goal_pos), tuple(middle_pos) if middle_pos else None,
+        weight, map_key, dose_key)
+    # キャッシュした経路を呼び出し側で書き換えられないよう、毎回新しいリストで返す
+    return list(path) if path is not None else None
+
+@functools.lru_cache(maxsize=32)
+def _find_optimal_route_cached(start_pos, goal_pos, middle_pos, weight, map_key, dose_key):
+    """find_optimal_route の本体。マップと線量はバイト列で受け取り、経路はタプルで返す"""
     #  dosis map がない場合は、線量ゼロのマップを作成
-    if not dose_map:
-        dose_map = [[0.0 for _ in range(MAP_COLS)] for _ in range(MAP_ROWS)]
+    if dose_key is None:
+        dose_flat = [0.0] * (MAP_ROWS * MAP_COLS)
+    else:
+        dose_flat = np.frombuffer(dose_key, dtype=np.float64).tolist()
+    dose_cost_flat = _dose_costs(dose_flat, weight)
+    # ★マップは区間ごとではなく1回だけ1次元に平坦化する
+    map_flat = np.frombuffer(map_key, dtype=np.int64).tolist()
 
     if middle_pos:
         # 1. スタートから中継点まで
-        path1 = run_astar(start_pos, middle_pos, map_data, dose_map, weight)
+        path1 = _run_astar_flat(start_pos, middle_pos, map_flat, dose_cost_flat)
         if not path1:
             return None # 最初の区間で見つからなければ失敗
 
         # 2. 中継点からゴールまで
-        path2 = run_astar(middle_pos, goal_pos, map_data, dose_map, weight)
+        path2 = _run_astar_flat(middle_pos, goal_pos, map_flat, dose_cost_flat)
         if not path2:
             return None # ２番目の区間で見つからなければ失敗
         
@@ -45,9 +85,13 @@ def find_optimal_route(start_pos, goal_pos, middle_pos, map_data, dose_map, weig
         full_path = path1 + path2[1:]
     else:
         # 中継点がない場合
-        full_path = run_astar(start_pos, goal_pos, map_data, dose_map, weight)
+        full_path = _run_astar_flat(start_pos, goal_pos, map_flat, dose_cost_flat)
+
+    return tuple(full_path) if full_path is not None else None
 
-    return full_path
+def _flatten_grid(grid):
+    """2次元のマップ (リストのリスト または numpy.ndarray) を r*MAP_COLS+c で引ける1次元リストにする"""
+    return np.asarray(grid).ravel().tolist()
 
 def run_astar(start, goal, map_data, dose_map, weight, record_values=False):
     """
@@ -60,13 +104,38 @@ def run_astar(start, goal, map_data, dose_map, weight, record_values=False):
         list or None: 経路のリスト。見つからなければNone。
         record_values=Trueの場合は (path, eval_data) のタプルを返す
     """
+    return _run_astar_flat(start, goal, _flatten_grid(map_data),
+                           _dose_costs(_flatten_grid(dose_map), weight), record_values)
+
+def _dose_costs(dose_flat, weight):
+    """
+    各マスの線量コスト (線量 × 重み係数) を1回だけ計算する。
+    重みと線量は探索中に変わらないため、緩和のたびに掛け算をしないで済む。
+    """
+    return [dose_val * weight for dose_val in dose_flat]
+
+def _run_astar_flat(start, goal, map_flat, dose_cost_flat, record_values=False):
+    """
+    run_astar の本体。マップと線量コスト (線量 × 重み係数) は1次元に平坦化したリストで受け取る。
+    ★探索中のマスは (row, col) のタプルではなく整数 r*cols+c で扱う
+      （大小関係はタプルと同じため、キューの並び順は変わらない）
+    """
     rows, cols = MAP_ROWS, MAP_COLS
+    start_idx = start[0] * cols + start[1]
+    goal_idx = goal[0] * cols + goal[1]
+    goal_r, goal_c = goal
+    # ★ヒューリスティック（マンハッタン距離）はゴールが決まれば行・列ごとに固定のため、
+    #   行方向・列方向の距離を1回だけ表にしておき、緩和のたびに足すだけにする
+    h_row = [abs(goal_r - r) for r in range(rows)]
+    h_col = [abs(goal_c - c) for c in range(cols)]
     
-    # (評価値, 実コスト, 現在位置, 経路リスト)
-    queue = [(0, 0, start, [start])]
+    # (評価値, 実コスト, 現在位置, 直前の位置)
+    # ★経路リストはキューに持たせず、各マスの直前の位置だけを記録し、ゴール到達時に1回だけ復元する
+    queue = [(0, 0, start_idx, None)]
     
-    visited = set()
-    min_costs = {start: 0}
+    # ★確定済みのマスは came_from に記録されるため、別途 visited 集合は持たない
+    min_costs = {start_idx: 0}
+    came_from = {}
     
     # 評価値を記録する辞書 (record_values=Trueのとき使用)
     # キー: (row, col), 値: {'f': f(n), 'g': g(n), 'h': h(n)}
@@ -75,48 +144,57 @@ def run_astar(start, goal, map_data, dose_map, weight, record_values=False):
     if record_values:
         eval_data[start] = {'f': 0, 'g': 0, 'h': abs(goal[0] - start[0]) + abs(goal[1] - start[1])}
     
+    # ★ゴールまでの実コストの上限。評価値がこれ以上のエントリはゴールより先に取り出されても
+    #   経路を変えないため、キューに積まない。
+    #   線量コストが負のときはヒューリスティックが許容的でなくなるため使わない。
+    #   評価値を記録する場合も、記録内容を変えないよう使わない。
+    use_bound = not record_values and min(dose_cost_flat, default=0) >= 0
+    best_goal_cost = math.inf
+    
     while queue:
-        priority, cost, current, path = heapq.heappop(queue)
+        priority, cost, current, parent = heapq.heappop(queue)
         
-        if current == goal:
+        if current == goal_idx:
+            came_from[current] = parent
+            path = _reconstruct_path(came_from, current, cols)
             if record_values:
                 return path, eval_data
             return path
         
-        if current in visited:
+        # より小さい実コストが見つかった後の古いエントリは読み飛ばす
+        if cost > min_costs[current]:
             continue
-        visited.add(current)
-        
-        r, c = current
+        # 確定済みのマスは再展開しない（負の重みでコストが減り続ける場合にも停止させるため）
+        if current in came_from:
+            continue
+        # 確定したマスの直前の位置を記録（取り出したエントリの経路を採用する）
+        came_from[current] = parent
         
-        # 上下左右の4方向を探索
-        for dr, dc in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-            nr, nc = r + dr, c + dc
-            
-            # マップ範囲外かチェック
-            if not (0 <= nr < rows and 0 <= nc < cols):
-                continue
+        # 上下左右の4方向を探索（マップ範囲内の隣接マスは事前に計算済み）
+        for next_idx, nr, nc in _NEIGHBORS[current]:
             # 壁かチェック
-            if map_data[nr][nc] == 1:
+            if map_flat[next_idx] == 1:
                 continue
             
-            next_pos = (nr, nc)
-            
             # コスト計算 = 移動コスト(1) + 線量コスト
-            dose_val = dose_map[nr][nc]
-            new_cost = cost + 1 + (dose_val * weight)
+            new_cost = cost + 1 + dose_cost_flat[next_idx]
             
-            if next_pos not in min_costs or new_cost < min_costs[next_pos]:
-                min_costs[next_pos] = new_cost
+            if new_cost < min_costs.get(next_idx, math.inf):
+                min_costs[next_idx] = new_cost
                 # ヒューリスティックコスト（マンハッタン距離）
-                heuristic = abs(goal[0] - nr) + abs(goal[1] - nc)
+                heuristic = h_row[nr] + h_col[nc]
                 # 評価値 = 実コスト + ヒューリスティックコスト
                 priority = new_cost + heuristic
-                heapq.heappush(queue, (priority, new_cost, next_pos, path + [next_pos]))
+                if use_bound:
+                    if next_idx == goal_idx:
+                        best_goal_cost = new_cost
+                    elif priority >= best_goal_cost:
+                        continue
+                heapq.heappush(queue, (priority, new_cost, next_idx, current))
                 
                 # 評価値を記録
                 if record_values:
-                    eval_data[next_pos] = {
+                    eval_data[(nr, nc)] = {
                         'f': priority,
                         'g': new_cost,
                         'h': heuristic
@@ -126,17 +204,37 @@ def run_astar(start, goal, map_data, dose_map, weight, record_values=False):
         return None, eval_data
     return None # ゴールに到達できなかった場合
 
+def _reconstruct_path(came_from, goal, cols):
+    """直前の位置の記録をゴールからたどり、スタートからゴールまでの (row, col) の経路リストを返す"""
+    path = []
+    pos = goal
+    while pos is not None:
+        path.append(divmod(pos, cols))
+        pos = came_from[pos]
+    path.reverse()
+    return path
+
 # ==========================================================================
 #  詳細評価用の経路点計算 (1021.pyより移植)
 # ==========================================================================
 
 def _distance(p1, p2):
     """3次元座標p1とp2のユークリッド距離を計算する"""
-    return math.sqrt(sum((b - a) ** 2 for a, b in zip(p1, p2)))
+    # ★ジェネレータと sum を使わず、3成分を直接計算する
+    #   （** 2 と左からの加算の順序は従来と同じため、結果も同じ値になる）
+    dx = p2[0] - p1[0]
+    dy = p2[1] - p1[1]
+    dz = p2[2] - p1[2]
+    return math.sqrt(dx ** 2 + dy ** 2 + dz ** 2)
 
-def _interpolate_point(p1, p2, ratio):
-    """p1とp2をratioで内分する点を計算する"""
-    return tuple(p1[i] + ratio * (p2[i] - p1[i]) for i in range(3))
+def _interpolate_segment(p1, p2, ratios):
+    """
+    p1とp2を ratios の各比率で内分する点 (p1 + ratio * (p2 - p1)) を、NumPy でまとめて計算してタプルのリストで返す。
+    """
+    a = np.asarray(p1, dtype=np.float64)[:3]
+    b = np.asarray(p2, dtype=np.float64)[:3]
+    points = a + ratios[:, None] * (b - a)
+    return list(map(tuple, points.tolist()))
 
 def compute_detailed_path_points(start_phys, mid_phys, end_phys, step_cm):
     """
@@ -145,14 +243,14 @@ def compute_detailed_path_points(start_phys, mid_phys, end_phys, step_cm):
     """
     path_points = [start_phys]
     
+    # ★各区間の内挿点は1点ずつではなく、比率の配列からまとめて計算する
     # --- スタート -> 中継点 ---
     if mid_phys:
         seg1_len = _distance(start_phys, mid_phys)
         if step_cm > 0 and seg1_len > 0:
             n_steps1 = int(seg1_len // step_cm)
-            for step in range(1, n_steps1 + 1):
-                ratio = (step * step_cm) / seg1_len
-                path_points.append(_interpolate_point(start_phys, mid_phys, ratio))
+            ratios = (np.arange(1, n_steps1 + 1) * step_cm) / seg1_len
+            path_points.extend(_interpolate_segment(start_phys, mid_phys, ratios))
         path_points.append(mid_phys)
         
         # --- 中継点 -> ゴール ---
@@ -164,9 +262,8 @@ def compute_detailed_path_points(start_phys, mid_phys, end_phys, step_cm):
     seg2_len = _distance(start_of_seg2, end_phys)
     if step_cm > 0 and seg2_len > 0:
         n_steps2 = int(seg2_len // step_cm)
-        for step in range(1, n_steps2 + 1):
-            ratio = (step * step_cm) / seg2_len
-            path_points.append(_interpolate_point(start_of_seg2, end_phys, ratio))
+        ratios = (np.arange(1, n_steps2 + 1) * step_cm) / seg2_len
+        path_points.extend(_interpolate_segment(start_of_seg2, end_phys, ratios))
     
     # 最後の点がゴールと完全一致でなければ、ゴールを追加
     if path_points[-1] != end_phys:
@@ -174,6 +271,20 @@ def compute_detailed_path_points(start_phys, mid_phys, end_phys, step_cm):
         
     return path_points
 
+def _drop_repeated_points(points):
+    """
+    直前の点と同じ座標の点を取り除く。
+    ★座標のタプルを辞書のキーにしてハッシュせず、隣り合う点どうしの比較だけで済ませる。
+      経路を往復する場合でも、離れた位置で同じ座標に戻った点は残る。
+    """
+    out = points[:1]
+    last = out[0] if out else None
+    for p in points[1:]:
+        if p != last:
+            out.append(p)
+            last = p
+    return out
+
 def resample_path_by_width(physical_path, step_width):
     """
     物理座標の経路を指定されたステップ幅で再サミングする。
@@ -184,50 +295,37 @@ def resample_path_by_width(physical_path, step_width):
 
     new_path = [physical_path[0]]
     
-    # 経路の全長を計算
-    total_distance = 0
-    for i in range(len(physical_path) - 1):
-        total_distance += _distance(physical_path[i], physical_path[i+1])
-
-    # サンプル点を置くべき距離を計算
-    distances_to_sample = []
-    d = step_width
-    while d < total_distance:
-        distances_to_sample.append(d)
-        d += step_width
-
-    if not distances_to_sample:
+    # ★区間の長さ・累積距離・サンプル点の割り当てを NumPy でまとめて計算する
+    pts = np.asarray(physical_path, dtype=np.float64)[:, :3]
+    deltas = pts[1:] - pts[:-1]
+    # 区間の長さは _distance と完全に同じ値にするため、区間ごとに _distance で求める
+    segment_lens = np.array([_distance(p1, p2) for p1, p2 in zip(physical_path, physical_path[1:])])
+    # 各区間の終端までの累積距離（先頭から順に足し合わせる）
+    segment_end_dists = np.cumsum(segment_lens)
+    total_distance = float(segment_end_dists[-1])
+
+    # サンプル点を置くべき距離を計算（ステップ幅を順に足し合わせた値）
+    n_max = int(total_distance // step_width) + 2
+    distances_to_sample = np.cumsum(np.full(n_max, float(step_width)))
+    distances_to_sample = distances_to_sample[distances_to_sample < total_distance]
+
+    if len(distances_to_sample) == 0:
         # ステップ幅より経路が短い場合は、中間点を追加するだけでも良い
         if total_distance > 0:
              new_path.append(physical_path[-1])
-        return list(dict.fromkeys(new_path)) # 重複削除
+        return _drop_repeated_points(new_path) # 重複削除
 
-    segment_start_dist = 0
-    sample_idx = 0
-    
-    for i in range(len(physical_path) - 1):
-        p1 = physical_path[i]
-        p2 = physical_path[i+1]
-        segment_len = _distance(p1, p2)
-        segment_end_dist = segment_start_dist + segment_len
-
-        if segment_len == 0:
-            continue
-
-        while sample_idx < len(distances_to_sample) and \
-              segment_start_dist <= distances_to_sample[sample_idx] < segment_end_dist:
-            
-            dist_from_p1 = distances_to_sample[sample_idx] - segment_start_dist
-            ratio = dist_from_p1 / segment_len
-            interpolated_point = _interpolate_point(p1, p2, ratio)
-            new_path.append(interpolated_point)
-            sample_idx += 1
-            
-        segment_start_dist = segment_end_dist
+    # 各サンプル点が含まれる区間 (始点の累積距離 <= 距離 < 終点の累積距離) を一括で求める
+    seg_idx = np.searchsorted(segment_end_dists, distances_to_sample, side='right')
+    segment_start_dists = np.empty_like(segment_end_dists)
+    segment_start_dists[0] = 0.0
+    segment_start_dists[1:] = segment_end_dists[:-1]
+    ratios = (distances_to_sample - segment_start_dists[seg_idx]) / segment_lens[seg_idx]
+    points = pts[seg_idx] + ratios[:, None] * deltas[seg_idx]
+    new_path.extend(map(tuple, points.tolist()))
 
     # 最後の点を必ず追加
     new_path.append(physical_path[-1])
     
     # 重複を削除して返す
-    return list(dict.fromkeys(new_path))
-
+    return _drop_repeated_points(new_path)
@@ -7,13 +7,44 @@
 
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
+import tkinter.font as tkfont
+
+# 行の背景色がこれらの色のときは文字を白で表示する
+_DARK_COLORS = frozenset({"black", "red", "blue", "green", "purple", "navy"})
 
 class SimulationControlsView(tk.Frame):
+    # ★スタイルを設定済みかどうかと、Treeview 用のフォント・行の高さ（全インスタンスで共有）
+    _style_initialized = False
+    _font = None
+    _row_px = None
+
     def __init__(self, master, callbacks):
         super().__init__(master)
         self.callbacks = callbacks
+        # Treeview の各行の (iid, 表示値, タグ)。update_route_tree で差分更新に使う
+        self._route_rows = []
+        # Treeview の iid から経路のインデックス (0-based) を引く辞書
+        self._iid_to_index = {}
+        # update_route_tree の描画待ちの経路リストと、描画を予約済みかどうか
+        self._pending_routes = None
+        self._refresh_scheduled = False
+        # 前回描画した経路リストの表示項目（変化が無ければ描画を省く）
+        self._last_sig = None
+        # 実行パネルは初めて表示されるまで作らないため、CSV保存ボタンの状態は別に持つ
+        self.save_csv_button = None
+        self._save_csv_enabled = False
+        # 設定済みの色タグ（タグの設定は色ごとに1回だけ行う）
+        self._configured_tags = set()
+
+        # スタイル設定（ttk のスタイルはアプリ全体で共有されるため、最初の1回だけ行う）
+        if not SimulationControlsView._style_initialized:
+            self._apply_style()
+            SimulationControlsView._style_initialized = True
+        
+        self.create_widgets()
 
-        # スタイル設定
+    def _apply_style(self):
+        """ttk のテーマとウィジェットのスタイルを設定する"""
         style = ttk.Style()
         style.theme_use('clam')
         style.configure("TButton", padding=8, font=("Meiryo UI", 10))
@@ -21,10 +52,12 @@ class SimulationControlsView(tk.Frame):
         style.configure("TEntry", padding=6, font=("Meiryo UI", 10))
         style.configure("TLabelframe", padding=10)
         style.configure("TLabelframe.Label", font=("Meiryo UI", 11, "bold"))
-        style.configure("Treeview", font=("Meiryo UI", 10), rowheight=25)
+        # ★行の高さはフォントの行間から1回だけ求めて固定する（25px 未満にはしない）
+        #   フォントはスタイルから参照され続けるため、クラス属性として保持する
+        SimulationControlsView._font = tkfont.Font(root=self, font=("Meiryo UI", 10))
+        SimulationControlsView._row_px = max(25, self._font.metrics('linespace') + 4)
+        style.configure("Treeview", font=self._font, rowheight=self._row_px)
         style.configure("Treeview.Heading", font=("Meiryo UI", 10, "bold"))
-        
-        self.create_widgets()
 
     def create_widgets(self):
         # --- 全体を上下左右に分割するPanedWindow ---
@@ -42,8 +75,18 @@ class SimulationControlsView(tk.Frame):
         top_paned.add(route_management_frame, weight=1)
 
         # --- 中-間部：シミュレーション実行 ---
-        action_frame = self._create_simulation_actions_panel(main_paned)
-        main_paned.add(action_frame, weight=4) # 下部の比率を大きくする
+        # ★中身は枠が初めて表示されたときに作る（それまでは空のフレームを置いておく）
+        self._action_placeholder = ttk.Frame(main_paned)
+        main_paned.add(self._action_placeholder, weight=4) # 下部の比率を大きくする
+        self._action_placeholder.bind("<Configure>", self._on_action_placeholder_configure)
+
+    def _on_action_placeholder_configure(self, event):
+        """実行パネルの枠に幅が割り当てられたら、初回だけ中身を作成する"""
+        if event.width <= 1 or self.save_csv_button is not None:
+            return
+        self._action_placeholder.unbind("<Configure>")
+        action_frame = self._create_simulation_actions_panel(self._action_placeholder)
+        action_frame.pack(fill=tk.BOTH, expand=True)
 
     def _create_route_management_panel(self, parent):
         frame = ttk.LabelFrame(parent, text="経路の管理", padding=10)
@@ -51,6 +94,7 @@ class SimulationControlsView(tk.Frame):
         # --- 経路リスト ---
         cols = ("#", "色", "係数ω", "ステップ幅(cm)", "総線量(Gy/source)")
         self.tree = ttk.Treeview(frame, columns=cols, show="headings", height=5) # 表示行数を5行に制限
+        self.tree.configure(displaycolumns=cols)
         for col in cols:
             self.tree.heading(col, text=col)
 
@@ -126,11 +170,18 @@ class SimulationControlsView(tk.Frame):
         save_button_frame = ttk.Frame(save_frame)
         save_button_frame.pack(fill=tk.X, padx=5, pady=4)
 
-        self.save_csv_button = ttk.Button(save_button_frame, text="結果をCSV形式で保存", command=self.callbacks["save_results_csv"], width=28, state="disabled")
+        self.save_csv_button = ttk.Button(save_button_frame, text="結果をCSV形式で保存", command=self.callbacks["save_results_csv"], width=28,
+                                          state="normal" if self._save_csv_enabled else "disabled")
         self.save_csv_button.pack(fill=tk.X, pady=2)
 
         return frame
 
+    def set_save_csv_enabled(self, enabled):
+        """「結果をCSV形式で保存」ボタンの有効・無効を切り替える（パネル作成前でも呼べる）"""
+        self._save_csv_enabled = enabled
+        if self.save_csv_button is not None:
+            self.save_csv_button.config(state="normal" if enabled else "disabled")
+
     def get_route_definition_data(self):
         """経路定義フォームから入力値を取得して辞書として返す"""
         # 核種と放射能は「環境入力を生成」で設定されるため、ここでは空の辞書を返す
@@ -142,8 +193,39 @@ class SimulationControlsView(tk.Frame):
         return "phits.bat"
 
     def update_route_tree(self, routes):
-        """指定された経路リストでTreeviewを更新する"""
-        self.tree.delete(*self.tree.get_children())
+        """
+        指定された経路リストでTreeviewを更新する。
+        ★実際の描画はアイドル時に1回だけ行い、続けて呼ばれた場合は最後の経路リストだけを描画する。
+        """
+        self._pending_routes = routes
+        if not self._refresh_scheduled:
+            self._refresh_scheduled = True
+            self.after_idle(self._do_refresh)
+
+    def _do_refresh(self):
+        """保留中の経路リストでTreeviewを描画する（after_idle から呼ばれる）"""
+        routes = self._pending_routes
+        self._pending_routes = None
+        self._refresh_scheduled = False
+        self._render_route_tree(routes)
+
+    def _render_route_tree(self, routes):
+        """
+        経路リストの内容をTreeviewに反映する。
+        ★全行を削除して作り直さず、表示内容が変わった行だけを書き換える。
+          増えた経路は末尾に追加し、減った分は末尾から削除する。
+        """
+        # ★表示に使う項目が前回の描画から変わっていなければ、何もしない
+        sig = tuple(
+            (r.get('color'), r.get('weight'), r.get('step_width'), r.get('total_dose'),
+             len(r['detailed_path']) if 'detailed_path' in r else None)
+            for r in routes
+        )
+        if sig == self._last_sig:
+            return
+        self._last_sig = sig
+
+        rows = []
         for i, r in enumerate(routes):
             step_info = f"{len(r['detailed_path'])} pts" if 'detailed_path' in r else r.get('step_width', 'N/A')
             color = r.get('color', 'black')
@@ -165,16 +247,53 @@ class SimulationControlsView(tk.Frame):
                 step_info,
                 dose_str,
             )
-            # 色のタグを設定
+            rows.append((values, color))
+
+        # ★色のタグは同じ色の行がいくつあっても、色ごとに1回だけ設定する
+        #   （一度設定したタグは以降の更新でも設定し直さない）
+        for color in {color for _, color in rows}:
+            tag_name = f"color_{color}"
+            if tag_name not in self._configured_tags:
+                self.tree.tag_configure(tag_name, background=color, foreground="white" if color in _DARK_COLORS else "black")
+                self._configured_tags.add(tag_name)
+
+        # 既存の行の内容が変わる・行が減る場合は、同じ行 (iid) が別の経路を指すことになるため選択を解除する
+        #   （例: 経路1を削除すると、先頭の行には元の経路2が表示される）
+        rows_changed = len(rows) < len(self._route_rows)
+
+        for i, (values, color) in enumerate(rows):
             tag_name = f"color_{color}"
-            self.tree.tag_configure(tag_name, background=color, foreground="white" if color in ["black", "red", "blue", "green", "purple", "navy"] else "black")
-            self.tree.insert("", "end", values=values, tags=(tag_name,))
+            if i < len(self._route_rows):
+                iid, old_values, old_tag = self._route_rows[i]
+                # 表示内容が変わっていない行は Tk に触らない
+                if (old_values, old_tag) != (values, tag_name):
+                    self.tree.item(iid, values=values, tags=(tag_name,))
+                    self._route_rows[i] = (iid, values, tag_name)
+                    rows_changed = True
+            else:
+                iid = self.tree.insert("", "end", values=values, tags=(tag_name,))
+                self._route_rows.append((iid, values, tag_name))
+                self._iid_to_index[iid] = i
+
+        if rows_changed:
+            selected = self.tree.selection()
+            if selected:
+                self.tree.selection_remove(selected)
+
+        # 経路が減った場合は余った行をまとめて削除
+        if len(self._route_rows) > len(routes):
+            removed = [iid for iid, _, _ in self._route_rows[len(routes):]]
+            self.tree.delete(*removed)
+            for iid in removed:
+                del self._iid_to_index[iid]
+            del self._route_rows[len(routes):]
+
     def get_selected_route_indices(self):
         """Treeviewで選択されているアイテムのインデックス(0-based)のリストを返す"""
-        selected_items = self.tree.selection()
-        if not selected_items:
-            return []
-        indices = [int(self.tree.item(item, "values")[0]) - 1 for item in selected_items]
+        # ★表示中の "#" 列を行ごとに読み出して解析せず、iid からインデックスを直接引く
+        #   （行は位置ごとに使い回すため、iid は常に「その位置の経路」を指す。
+        #    経路の削除などで行の表示内容が変わるときは、描画側で選択を解除している）
+        indices = [self._iid_to_index[item] for item in self.tree.selection()]
         return sorted(indices, reverse=True) # 逆順ソートで削除時のインデックスエラーを防ぐ
 
     def log(self, message):
@@ -4,13 +4,54 @@
 複数のモジュールで共有される可能性のある、汎用的な便利関数を格納するモジュール。
 """
 
+import hashlib
 import json
 import os
-from app_config import MAP_ROWS, CELL_SIZE_X, CELL_SIZE_Y, CELL_HEIGHT_Z
+import threading
+import numpy as np
+from app_config import MAP_ROWS, MAP_COLS, CELL_SIZE_X, CELL_SIZE_Y, CELL_HEIGHT_Z
+
+# orjson がインストールされていれば JSON の読み書きに使う（無ければ標準の json を使う）
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def build_coord_grid():
+    """
+    全マスの物理座標を、列ごとの X 範囲・行ごとの Y 範囲の1次元配列として計算する。
+    マスの座標の計算式はここだけに置き、get_physical_coords / get_physical_coords_array はこの結果を引いて使う。
+    グリッド全体を get_physical_coords でループせずに済むよう、呼び出し側で
+    x_min[cs], y_min[rs] のように行・列インデックスで引いて使う。
+
+    Returns:
+        tuple: (x_min, x_max, y_min, y_max)
+               x_min, x_max は長さ MAP_COLS、y_min, y_max は長さ MAP_ROWS の np.ndarray
+    """
+    cs = np.arange(MAP_COLS)
+    rs = np.arange(MAP_ROWS)
+    x_min = cs * CELL_SIZE_X
+    x_max = (cs + 1) * CELL_SIZE_X
+    # GUIの行番号 r=0 が物理座標のY最大値に対応するため、変換する
+    y_max = (MAP_ROWS - rs) * CELL_SIZE_Y
+    y_min = (MAP_ROWS - rs - 1) * CELL_SIZE_Y
+    return x_min, x_max, y_min, y_max
+
+def _build_coord_table():
+    """build_coord_grid の結果から、マスごとの座標タプルの表 (行 → 列) を作る"""
+    x_min, x_max, y_min, y_max = (a.tolist() for a in build_coord_grid())
+    return tuple(
+        tuple((x_min[c], x_max[c], y_min[r], y_max[r], 0.0, CELL_HEIGHT_Z) for c in range(MAP_COLS))
+        for r in range(MAP_ROWS)
+    )
+
+# ★get_physical_coords 用の全マスの座標表（起動時に1回だけ作る）
+_COORD_TABLE = _build_coord_table()
 
 def get_physical_coords(r, c):
     """
-    GUIのグリッド座標 (row, col) から物理座標 (x_min, x_max, y_min, y_max, z_min, z_max) を計算する。
+    GUIのグリッド座標 (row, col) から物理座標 (x_min, x_max, y_min, y_max, z_min, z_max) を返す。
+    ★起動時に作成した座標表 (_COORD_TABLE) から引くだけで済ませる。
     
     Args:
         r (int): グリッドの行インデックス (0-indexed)
@@ -18,22 +59,68 @@ def get_physical_coords(r, c):
 
     Returns:
         tuple: (x_min, x_max, y_min, y_max, z_min, z_max)
+
+    Raises:
+        IndexError: (r, c) がマップの外の場合
     """
-    x_min = c * CELL_SIZE_X
-    x_max = (c + 1) * CELL_SIZE_X
-    
-    # GUIの行番号 r=0 が物理座標のY最大値に対応するため、変換する
-    y_max = (MAP_ROWS - r) * CELL_SIZE_Y
-    y_min = (MAP_ROWS - r - 1) * CELL_SIZE_Y
-    
-    z_min = 0.0
-    z_max = CELL_HEIGHT_Z
-    
-    return x_min, x_max, y_min, y_max, z_min, z_max
+    if not (0 <= r < MAP_ROWS and 0 <= c < MAP_COLS):
+        raise IndexError(f"マップ外のマスです: ({r}, {c})")
+    return _COORD_TABLE[r][c]
+
+def get_physical_coords_array(rs, cs):
+    """
+    get_physical_coords の配列版。行・列インデックスの配列から、各マスの物理座標を
+    build_coord_grid の表を引いてまとめて求める。
+
+    Args:
+        rs (array_like): グリッドの行インデックスの配列 (0-indexed)
+        cs (array_like): グリッドの列インデックスの配列 (0-indexed)
+
+    Returns:
+        tuple: (x_min, x_max, y_min, y_max, z_min, z_max) の各 np.ndarray
+
+    Raises:
+        IndexError: マップの外のマスが含まれる場合
+    """
+    rs, cs = np.broadcast_arrays(np.asarray(rs, dtype=np.intp), np.asarray(cs, dtype=np.intp))
+    if rs.size and (rs.min() < 0 or rs.max() >= MAP_ROWS or cs.min() < 0 or cs.max() >= MAP_COLS):
+        raise IndexError("マップ外のマスが含まれています")
+    x_min, x_max, y_min, y_max = build_coord_grid()
+    return (x_min[cs], x_max[cs], y_min[rs], y_max[rs],
+            np.zeros(rs.shape), np.full(rs.shape, CELL_HEIGHT_Z))
+
+def map_to_array(map_data):
+    """マップデータ(2次元リスト)を int8 の2次元配列に変換する"""
+    return np.asarray(map_data, dtype=np.int8)
+
+def array_to_map(arr):
+    """2次元配列をマップデータ(2次元リスト)に戻す"""
+    return np.asarray(arr).tolist()
+
+def save_map_npz(filepath, arr):
+    """
+    マップの配列を圧縮した .npz 形式で保存する。
+    ★セルの種類は少数の小さな整数のため、int8 にして DEFLATE で圧縮すると非常に小さくなる。
+    """
+    with open(filepath, 'wb') as f:
+        np.savez_compressed(f, map=map_to_array(arr))
+
+def load_map_npz(filepath):
+    """save_map_npz で保存したマップの配列を読み込む"""
+    with np.load(filepath) as data:
+        return data['map']
+
+def _check_map_shape(arr):
+    """バイナリ形式で読み込んだマップの配列が MAP_ROWS × MAP_COLS であることを確認する"""
+    if arr.shape != (MAP_ROWS, MAP_COLS):
+        raise ValueError(f"マップの大きさが {MAP_ROWS}×{MAP_COLS} ではありません: {arr.shape}")
+    return arr
 
 def save_map_to_json(map_data, filepath):
     """
     マップデータ(2次元リスト)をJSON形式で保存する。
+    拡張子が .npy の場合は NumPy のバイナリ形式、.npz の場合は圧縮した配列で保存する（いずれも int8）。
+    .json の場合は、読み込みを速くするための int8 のサイドカー (.json.bin、JSON のダイジェスト付き) も書き出す。
     
     Args:
         map_data (list): マップの2次元配列
@@ -43,16 +130,79 @@ def save_map_to_json(map_data, filepath):
         bool: 保存成功時True、失敗時False
     """
     try:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(map_data, f, indent=2)
+        if filepath.lower().endswith('.npy'):
+            # ★1マス1バイトの配列として書き出し、数値の文字列化を省く
+            with open(filepath, 'wb') as f:
+                np.save(f, map_to_array(map_data))
+        elif filepath.lower().endswith('.npz'):
+            save_map_npz(filepath, map_data)
+        elif orjson is not None:
+            with open(filepath, 'wb') as f:
+                f.write(orjson.dumps(map_data, option=orjson.OPT_INDENT_2))
+        else:
+            with open(filepath, 'w', encoding='utf-8') as f:
+                json.dump(map_data, f, indent=2)
+        if filepath.lower().endswith('.json'):
+            _write_map_sidecar(map_data, filepath)
         return True
     except Exception as e:
         print(f"マップ保存エラー: {e}")
         return False
 
+# サイドカーの先頭に置く、元の JSON ファイルの内容のダイジェストの長さ (バイト)
+_SIDECAR_DIGEST_SIZE = 16
+
+def _json_digest(filepath):
+    """JSON ファイルの内容 (バイト列) のダイジェストを返す"""
+    with open(filepath, 'rb') as f:
+        return hashlib.blake2b(f.read(), digest_size=_SIDECAR_DIGEST_SIZE).digest()
+
+def _write_map_sidecar(map_data, filepath):
+    """
+    JSON と同じ内容のマップを、int8 の生バイト列 (filepath + '.bin') としても書き出す。
+    先頭には書き出した JSON の内容のダイジェストを置き、読み込み時に JSON と対応しているかを確かめる。
+    マップの大きさが MAP_ROWS × MAP_COLS でない場合や int8 に収まらない場合は作らない
+    （古いサイドカーが残っていれば削除する）。サイドカーの失敗は保存の失敗とは扱わない。
+    """
+    bin_path = filepath + '.bin'
+    try:
+        arr = np.asarray(map_data)
+    except ValueError:
+        arr = None # 行の長さが揃っていない
+    try:
+        if (arr is not None and arr.shape == (MAP_ROWS, MAP_COLS) and arr.dtype.kind in 'iu'
+                and arr.min() >= -128 and arr.max() <= 127):
+            with open(bin_path, 'wb') as f:
+                f.write(_json_digest(filepath))
+                f.write(arr.astype(np.int8).tobytes())
+        elif os.path.exists(bin_path):
+            os.remove(bin_path)
+    except OSError as e:
+        print(f"マップのサイドカー保存エラー: {e}")
+
+def _read_map_sidecar(filepath):
+    """
+    _write_map_sidecar で書き出したサイドカーがあれば読み込む。
+    サイドカーが無い・大きさが合わない・JSON の現在の内容とダイジェストが一致しない場合
+    （JSON が別の内容に置き換えられた場合など）は None を返す。JSON が常に正とする。
+    """
+    bin_path = filepath + '.bin'
+    try:
+        with open(bin_path, 'rb') as f:
+            data = f.read()
+        if (len(data) != _SIDECAR_DIGEST_SIZE + MAP_ROWS * MAP_COLS
+                or data[:_SIDECAR_DIGEST_SIZE] != _json_digest(filepath)):
+            return None
+        cells = np.frombuffer(data, dtype=np.int8, offset=_SIDECAR_DIGEST_SIZE)
+        return cells.reshape(MAP_ROWS, MAP_COLS).tolist()
+    except OSError:
+        return None
+
 def load_map_from_json(filepath):
     """
     JSON形式のマップデータを読み込む。
+    拡張子が .npy / .npz の場合は、NumPy のバイナリ形式として読み込む（大きさが MAP_ROWS × MAP_COLS でなければエラー）。
+    JSON の場合、保存時に作成したサイドカー (.json.bin) が JSON の現在の内容と対応していればそちらを使う。
     
     Args:
         filepath (str): 読み込むファイルパス
@@ -61,9 +211,41 @@ def load_map_from_json(filepath):
         list: マップの2次元配列、読み込み失敗時はNone
     """
     try:
+        if filepath.lower().endswith('.npy'):
+            return array_to_map(_check_map_shape(np.load(filepath)))
+        if filepath.lower().endswith('.npz'):
+            return array_to_map(_check_map_shape(load_map_npz(filepath)))
+        # ★JSON と同時に保存したバイナリのサイドカーがあれば、JSON を解析せずにそちらを読む
+        map_data = _read_map_sidecar(filepath)
+        if map_data is not None:
+            return map_data
+        if orjson is not None:
+            with open(filepath, 'rb') as f:
+                return orjson.loads(f.read())
         with open(filepath, 'r', encoding='utf-8') as f:
             map_data = json.load(f)
         return map_data
     except Exception as e:
         print(f"マップ読み込みエラー: {e}")
         return None
+
+def save_map_to_json_async(map_data, filepath, on_done):
+    """
+    save_map_to_json をバックグラウンドスレッドで実行し、GUIを止めずに保存する。
+    完了後、ワーカースレッドから on_done(保存成功か) を呼ぶ。
+    ★on_done はメインスレッド以外から呼ばれるため、GUIの操作はキューなどを介して行うこと。
+    """
+    # 保存中に編集されても影響を受けないよう、呼び出し時点の内容を複製しておく
+    snapshot = [list(row) for row in map_data]
+    thread = threading.Thread(target=lambda: on_done(save_map_to_json(snapshot, filepath)), daemon=True)
+    thread.start()
+    return thread
+
+def load_map_from_json_async(filepath, on_done):
+    """
+    load_map_from_json をバックグラウンドスレッドで実行する。
+    完了後、ワーカースレッドから on_done(マップの2次元配列 または None) を呼ぶ。
+    """
+    thread = threading.Thread(target=lambda: on_done(load_map_from_json(filepath)), daemon=True)
+    thread.start()
+    return thread
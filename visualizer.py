@@ -2,48 +2,137 @@
 
 """
 matplotlibを使用したグラフ描画機能を担当するモジュール。
+matplotlib 3.5 以降が必要（図の作成時に layout='constrained' を指定するため）。
 """
 
-import matplotlib
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-
-import matplotlib.font_manager as fm
+import functools
+import numpy as np
 from pathlib import Path
 from config_loader import get_config
 
+# ★matplotlib は読み込みに時間がかかるため、モジュールの先頭では読み込まず、
+#   グラフを描画する各関数の中で初めて読み込む（2回目以降は sys.modules から取得されるだけ）
+
+# ★この点数を超える経路の線・マーカーはラスタ化して描画する（ベクタ出力で点を1つずつ描かない）
+_RASTERIZE_MIN_POINTS = 1000
+# ★1経路あたりに描画する点の目安の上限（これを超える経路は一定間隔で間引いて描画する）
+_PLOT_MAX_POINTS = 5000
+# ★凡例に経路を1本ずつ並べる上限（これを超える場合は "Routes (N)" の1項目にまとめ、凡例のレイアウトを軽くする）
+_LEGEND_MAX_ROUTES = 20
+# ★各グラフのウィンドウ名。同じグラフを再表示するときは、開いたままのウィンドウを消去して使い回し、
+#   ウィンドウとキャンバスを毎回作り直さない
+_FIG_ROUTES_3D = "Routes 3D"
+_FIG_ROUTES_2D = "Routes 2D"
+_FIG_DOSE_PROFILE = "Dose Profile"
+_FIG_ASTAR_EVAL = "A* Evaluation"
+
+# ★長い経路を描画するときの Agg 描画設定
+#   path.simplify: 画面上で見分けのつかない中間点（直線上に並ぶ評価点など）を描画前に間引く
+#   agg.path.chunksize: 点数の多いパスを分割して描画し、Agg が巨大なバッファを1度に確保しないようにする
+#   バックエンド自体は変更しない（GUI から plt.show() で対話的に表示するため）
+_RENDER_RC = {
+    'path.simplify': True,
+    'path.simplify_threshold': 1.0,
+    'agg.path.chunksize': 10000,
+}
+
 _japanese_font_found = False
 _font_prop = None
+_render_tuned = False
 
-def set_japanese_font():
+def _tune_rendering():
     """
-    日本語対応フォントをmatplotlibに設定する。
-    設定ファイルから指定されたディレクトリ内の日本語フォントを探し、最初に見つかったものを利用する。
+    _RENDER_RC の描画設定を matplotlib に反映する。★最初の1回だけ行う。
     """
-    global _japanese_font_found, _font_prop
-    if _japanese_font_found:
-        if _font_prop:
-            plt.rcParams['font.family'] = _font_prop.get_name()
+    global _render_tuned
+    if _render_tuned:
         return
+    import matplotlib.pyplot as plt
+    plt.rcParams.update(_RENDER_RC)
+    _render_tuned = True
 
+@functools.lru_cache(maxsize=1)
+def _find_japanese_font():
+    """
+    設定ファイルから指定されたディレクトリ内の日本語フォントを探し、最初に見つかったもののパスを返す。
+    ★探索は初回だけ行い、結果（見つからなかった場合の None も含む）をキャッシュする。
+    """
     config = get_config()
     font_dir = Path(config.get_font_directory())
-    font_files = config.get_font_files()
-    
-    found_font_path = None
-    for font_file in font_files:
+    for font_file in config.get_font_files():
         path = font_dir / font_file
         if path.exists():
-            found_font_path = str(path)
-            break
-            
+            return str(path)
+    print("Warning: Japanese font not found. Text in graphs may be garbled.")
+    return None
+
+def set_japanese_font():
+    """
+    日本語対応フォントをmatplotlibに設定する。
+    設定ファイルから指定されたディレクトリ内の日本語フォントを探し、最初に見つかったものを利用する。
+    """
+    global _japanese_font_found, _font_prop
+    # ★設定済みであれば何もしない
+    if _font_prop is not None:
+        return
+
+    import matplotlib.pyplot as plt
+    import matplotlib.font_manager as fm
+
+    found_font_path = _find_japanese_font()
     if found_font_path:
         _font_prop = fm.FontProperties(fname=found_font_path)
         plt.rcParams['font.family'] = _font_prop.get_name()
         _japanese_font_found = True
         print(f"Japanese font '{_font_prop.get_name()}' ({found_font_path}) was set.")
-    else:
-        print("Warning: Japanese font not found. Text in graphs may be garbled.")
+
+@functools.lru_cache(maxsize=32)
+def _viridis_colors(n):
+    """
+    viridis カラーマップから i/n (i = 0..n-1) の位置の色を引いた (n, 4) の RGBA 配列を返す。
+    ★同じ経路数で何度も描画するときに色を引き直さないようキャッシュする（共有するため読み取り専用にする）。
+    """
+    import matplotlib.pyplot as plt
+    colors = plt.cm.viridis(np.arange(n) / max(n, 1))
+    colors.setflags(write=False)
+    return colors
+
+def _legend_font(size):
+    """
+    凡例用のフォント設定 (日本語フォント + 指定サイズ) を返す。
+    ★ax.legend(prop=...) にそのまま渡し、凡例を作った後で文字を1つずつ設定し直さない。
+    """
+    import matplotlib.font_manager as fm
+    prop = _font_prop.copy() if _font_prop is not None else fm.FontProperties()
+    prop.set_size(size)
+    return prop
+
+def _path_array(route):
+    """
+    経路の detailed_path を (点数, 3) の float64 配列に変換して返す。
+    ★変換結果は route["_path_xyz"] に (元のリスト, 配列) として保存し、同じ経路を再び描画するときに使い回す
+      （detailed_path が別のリストに置き換えられた場合は作り直す）。
+    """
+    path = route["detailed_path"]
+    cached = route.get("_path_xyz")
+    if cached is not None and cached[0] is path:
+        return cached[1]
+    arr = np.asarray(path, dtype=np.float64)[:, :3]
+    route["_path_xyz"] = (path, arr)
+    return arr
+
+def _downsample(arr):
+    """
+    点数が _PLOT_MAX_POINTS を大きく超える経路の座標配列を、一定間隔で間引いて返す。
+    画面の画素数より多い点を描画しても見た目は変わらないため。最後の点は必ず残す。
+    """
+    stride = max(1, len(arr) // _PLOT_MAX_POINTS)
+    if stride == 1:
+        return arr
+    thinned = arr[::stride]
+    if (len(arr) - 1) % stride:
+        thinned = np.concatenate([thinned, arr[-1:]])
+    return thinned
 
 def visualize_routes_3d(routes, sources):
     """
@@ -54,36 +143,58 @@ def visualize_routes_3d(routes, sources):
                              各辞書には "detailed_path" キーが含まれている必要がある。
         sources (list[tuple]): 線源の(x, y, z)座標のリスト。
     """
+    import matplotlib.pyplot as plt
+    # 3D 投影 ('3d') は matplotlib 3.2 以降では自動で登録されるため Axes3D の import は不要
+    from mpl_toolkits.mplot3d.art3d import Line3DCollection
     set_japanese_font() # ★フォント設定を呼び出し
+    _tune_rendering()
     if not routes:
         print("可視化対象の経路がありません。")
         return
 
-    fig = plt.figure(figsize=(10, 8))
+    fig = plt.figure(_FIG_ROUTES_3D, figsize=(10, 8), clear=True, layout='constrained')
     ax = fig.add_subplot(111, projection='3d')
     
     # カラーマップを設定
-    colors = plt.cm.viridis([i/len(routes) for i in range(len(routes))])
+    # ★色は i/N の値を配列にまとめて1回で引く（経路数ごとにキャッシュ）
+    colors = _viridis_colors(len(routes))
 
+    # ★各経路の座標は (点数, 3) の配列に1回だけ変換して使う
+    path_arrays = []
+    route_colors = []
+    route_numbers = []
     for idx, route in enumerate(routes):
         path = route.get("detailed_path")
         if not path:
             continue
             
-        color = colors[idx]
-        
-        # 経路（評価点）をプロット
-        xs = [p[0] for p in path]
-        ys = [p[1] for p in path]
-        zs = [p[2] for p in path]
-        ax.plot(xs, ys, zs, marker='o', markersize=6, linestyle='-', linewidth=2.5, color=color, label=f"Route {idx+1}")
-        
+        path_arrays.append(_path_array(route))
+        route_colors.append(colors[idx])
+        route_numbers.append(idx + 1)
+
+    # 凡例用（データを持たない線。描画は下の Line3DCollection でまとめて行う）
+    if len(path_arrays) <= _LEGEND_MAX_ROUTES:
+        for number, color in zip(route_numbers, route_colors):
+            ax.plot([], [], [], marker='o', markersize=6, linestyle='-', linewidth=2.5, color=color, label=f"Route {number}")
+    else:
+        ax.plot([], [], [], marker='o', markersize=6, linestyle='-', linewidth=2.5, color='gray', label=f"Routes ({len(path_arrays)})")
+
+    # 経路（評価点）をプロット
+    # ★経路ごとに ax.plot で線を作らず、全経路の線を1つの Line3DCollection、
+    #   評価点のマーカーを1つの scatter にまとめて描画する
+    if path_arrays:
+        shown_xyz = [_downsample(arr) for arr in path_arrays]
+        point_counts = [len(arr) for arr in shown_xyz]
+        rasterized = sum(point_counts) > _RASTERIZE_MIN_POINTS
+        ax.add_collection3d(Line3DCollection(shown_xyz, colors=route_colors, linewidths=2.5, rasterized=rasterized))
+        points = np.concatenate(shown_xyz)
+        ax.scatter(points[:, 0], points[:, 1], points[:, 2], s=6 ** 2, c=np.repeat(route_colors, point_counts, axis=0),
+                   marker='o', linewidths=1.0, edgecolors='face', depthshade=False, rasterized=rasterized)
+
     # 線源をプロット (引数から受け取る)
+    source_array = np.asarray(sources, dtype=np.float64).reshape(-1, 3)
     if sources:
-        sx = [s[0] for s in sources]
-        sy = [s[1] for s in sources]
-        sz = [s[2] for s in sources]
-        ax.scatter(sx, sy, sz, color='red', marker='*', s=600, edgecolors='black', linewidths=2, label="Sources")
+        ax.scatter(source_array[:, 0], source_array[:, 1], source_array[:, 2], color='red', marker='*', s=600, edgecolors='black', linewidths=2, label="Sources")
 
     ax.set_xlabel("X-axis [cm]", fontproperties=_font_prop, fontsize=14)
     ax.set_ylabel("Y-axis [cm]", fontproperties=_font_prop, fontsize=14)
@@ -94,36 +205,23 @@ def visualize_routes_3d(routes, sources):
     ax.tick_params(axis='both', which='major', labelsize=12)
     
     # 凡例のフォントも設定
-    legend = ax.legend(fontsize=13)
-    for text in legend.get_texts():
-        text.set_font_properties(_font_prop)
+    ax.legend(prop=_legend_font(13))
     
     # グリッド表示
     ax.grid(True, alpha=0.3)
     
     # アスペクト比を調整（データ範囲に基づいて設定）
-    all_x = [p[0] for r in routes for p in r.get("detailed_path", [])] + [s[0] for s in sources]
-    all_y = [p[1] for r in routes for p in r.get("detailed_path", [])] + [s[1] for s in sources]
-    all_z = [p[2] for r in routes for p in r.get("detailed_path", [])] + [s[2] for s in sources]
+    # ★全経路・線源の座標を1つの配列にまとめ、各軸の範囲を一括で求める
+    all_xyz = np.concatenate(path_arrays + [source_array])
     
-    if all_x and all_y and all_z:
-        range_x = max(all_x) - min(all_x)
-        range_y = max(all_y) - min(all_y)
-        range_z = max(all_z) - min(all_z)
+    if len(all_xyz):
         # mplot3d の内部変換行列が singular もしくは zero-range になると
         # inv_transform が None を返し、マウス移動時などに TypeError を投げることがある。
         # そのため 0 にならないよう小さな値でパディングする。
         eps = 1e-6
-        if range_x <= 0: range_x = eps
-        if range_y <= 0: range_y = eps
-        if range_z <= 0: range_z = eps
-        try:
-            ax.set_box_aspect([range_x, range_y, range_z]) # For matplotlib 3.1+
-        except Exception:
-            # 万が一 matplotlib のバージョン差等で失敗しても可視化自体は続行する
-            pass
+        ranges = np.maximum(np.ptp(all_xyz, axis=0), eps)
+        ax.set_box_aspect(ranges.tolist())
 
-    plt.tight_layout()
     plt.show()
 
 
@@ -132,8 +230,14 @@ def visualize_routes_2d(routes, sources, map_data=None):
     登録されたすべての経路、線源、障害物を2Dのトップダウン（X-Y平面）で可視化する。
     経路ごとに色分けして表示する。
     """
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection, PatchCollection
+    from matplotlib.colors import to_rgba_array
     set_japanese_font()
-    if not any(r.get("detailed_path") for r in routes):
+    _tune_rendering()
+    # ★詳細経路を持つ経路を1回の走査で抜き出し、空ならここで終了する（下の描画ループでも使う）
+    routes_with_path = [(idx, route) for idx, route in enumerate(routes) if route.get("detailed_path")]
+    if not routes_with_path:
         print("可視化対象の詳細経路がありません。")
         return
 
@@ -144,59 +248,79 @@ def visualize_routes_2d(routes, sources, map_data=None):
         map_height = MAP_ROWS * CELL_SIZE_Y
         aspect_ratio = map_width / map_height
         fig_width = max(10, 10 * aspect_ratio)  # 最小幅10、アスペクト比に応じて拡大
-        fig, ax = plt.subplots(figsize=(fig_width, 10))
+        fig, ax = plt.subplots(figsize=(fig_width, 10), num=_FIG_ROUTES_2D, clear=True, layout='constrained')
     else:
-        fig, ax = plt.subplots(figsize=(10, 8))
+        fig, ax = plt.subplots(figsize=(10, 8), num=_FIG_ROUTES_2D, clear=True, layout='constrained')
 
     # 障害物（壁）を描画
     if map_data is not None:
         from app_config import MAP_ROWS, MAP_COLS, CELL_SIZE_X, CELL_SIZE_Y
-        from utils import get_physical_coords
+        from utils import get_physical_coords_array
         
         # グリッドラインを描画（セル境界）
-        for r in range(MAP_ROWS + 1):
-            y_val = r * CELL_SIZE_Y
-            ax.axhline(y=y_val, color='lightgray', linewidth=0.5, linestyle='--', alpha=0.5, zorder=0)
-        
-        for c in range(MAP_COLS + 1):
-            x_val = c * CELL_SIZE_X
-            ax.axvline(x=x_val, color='lightgray', linewidth=0.5, linestyle='--', alpha=0.5, zorder=0)
+        # ★axhline / axvline を1本ずつ追加せず、横線・縦線をそれぞれ1つの LineCollection にまとめる
+        #   （axhline と同じく、線の長さは軸の端から端まで＝軸座標 0〜1）
+        grid_style = dict(colors='lightgray', linewidths=0.5, linestyles='--', alpha=0.5, zorder=0)
+        ax.add_collection(LineCollection(
+            [[(0, r * CELL_SIZE_Y), (1, r * CELL_SIZE_Y)] for r in range(MAP_ROWS + 1)],
+            transform=ax.get_yaxis_transform(), **grid_style), autolim=False)
+        ax.add_collection(LineCollection(
+            [[(c * CELL_SIZE_X, 0), (c * CELL_SIZE_X, 1)] for c in range(MAP_COLS + 1)],
+            transform=ax.get_xaxis_transform(), **grid_style), autolim=False)
+        ax.update_datalim([(0, 0), (MAP_COLS * CELL_SIZE_X, MAP_ROWS * CELL_SIZE_Y)])
         
-        for r in range(MAP_ROWS):
-            for c in range(MAP_COLS):
-                if map_data[r][c] == 1:  # 壁
-                    x_min, x_max, y_min, y_max, _, _ = get_physical_coords(r, c)
-                    rect = plt.Rectangle((x_min, y_min), x_max - x_min, y_max - y_min,
-                                        facecolor='gray', edgecolor='black', 
-                                        alpha=0.6, linewidth=1, zorder=1)
-                    ax.add_patch(rect)
-
-    all_x = []
-    all_y = []
+        # ★壁のマスを NumPy でまとめて抽出し、座標も一括で計算する
+        #   壁は1マスずつ add_patch せず、1つの PatchCollection として追加する
+        wall_rs, wall_cs = np.nonzero(np.asarray(map_data)[:MAP_ROWS, :MAP_COLS] == 1)
+        wall_x_min, wall_x_max, wall_y_min, wall_y_max, _, _ = get_physical_coords_array(wall_rs, wall_cs)
+        wall_rects = [plt.Rectangle((x_min, y_min), x_max - x_min, y_max - y_min)
+                      for x_min, x_max, y_min, y_max in zip(wall_x_min.tolist(), wall_x_max.tolist(),
+                                                            wall_y_min.tolist(), wall_y_max.tolist())]
+        if wall_rects:
+            ax.add_collection(PatchCollection(wall_rects, facecolor='gray', edgecolor='black',
+                                              alpha=0.6, linewidth=1, zorder=1))
 
-    for idx, route in enumerate(routes):
-        path = route.get("detailed_path")
-        if not path:
-            continue
+    # ★各経路の XY 座標は (点数, 2) の配列に1回だけ変換し、列を切り出して使う
+    all_xy = []
+    route_colors = []
+    per_route_legend = len(routes_with_path) <= _LEGEND_MAX_ROUTES
 
+    for idx, route in routes_with_path:
         color = route.get('color', 'gray')
-        xs = [p[0] for p in path]
-        ys = [p[1] for p in path]
-        ax.plot(xs, ys, marker='o', markersize=12, linestyle='-', linewidth=4, color=color, label=f"Route {idx+1}")
-        all_x.extend(xs)
-        all_y.extend(ys)
-        
-        # 始点と終点を強調
-        ax.scatter(xs[0], ys[0], color=color, marker='^', s=600, edgecolors='black', linewidths=2.4, zorder=5) # Start
-        ax.scatter(xs[-1], ys[-1], color=color, marker='s', s=600, edgecolors='black', linewidths=2.4, zorder=5) # Goal
+        arr = _path_array(route)[:, :2]
+        all_xy.append(arr)
+        route_colors.append(color)
+        # 凡例用（データを持たない線。描画は下の LineCollection でまとめて行う）
+        if per_route_legend:
+            ax.plot([], [], marker='o', markersize=12, linestyle='-', linewidth=4, color=color, label=f"Route {idx+1}")
+    if not per_route_legend:
+        ax.plot([], [], marker='o', markersize=12, linestyle='-', linewidth=4, color='gray', label=f"Routes ({len(all_xy)})")
+
+    # ★経路ごとに ax.plot で線を作らず、全経路の線を1つの LineCollection、
+    #   評価点のマーカーを1つの scatter にまとめて描画する
+    if all_xy:
+        shown_xy = [_downsample(arr) for arr in all_xy]
+        point_counts = [len(arr) for arr in shown_xy]
+        rasterized = sum(point_counts) > _RASTERIZE_MIN_POINTS
+        ax.add_collection(LineCollection(shown_xy, colors=route_colors, linewidths=4, zorder=2,
+                                         capstyle="projecting", joinstyle="round", rasterized=rasterized))
+        point_colors = np.repeat(to_rgba_array(route_colors), point_counts, axis=0)
+        ax.scatter(*np.concatenate(shown_xy).T, s=12 ** 2, c=point_colors, marker='o', linewidths=1.0, zorder=2,
+                   rasterized=rasterized)
+
+        # 始点と終点を強調（全経路の終点・始点をそれぞれ1回の scatter で描画する）
+        # 経路をつなげた場合に次の経路の始点が前の経路の終点の上に重なるよう、終点を先に描く
+        route_rgba = to_rgba_array(route_colors)
+        goals = np.array([arr[-1] for arr in all_xy])
+        starts = np.array([arr[0] for arr in all_xy])
+        ax.scatter(goals[:, 0], goals[:, 1], c=route_rgba, marker='s', s=600, edgecolors='black', linewidths=2.4, zorder=5) # Goal
+        ax.scatter(starts[:, 0], starts[:, 1], c=route_rgba, marker='^', s=600, edgecolors='black', linewidths=2.4, zorder=5) # Start
 
     # 線源をプロット (Zは無視してXY投影)
     if sources:
-        sx = [s[0] for s in sources]
-        sy = [s[1] for s in sources]
-        ax.scatter(sx, sy, color='yellow', marker='*', s=1000, edgecolors='black', linewidths=3, label='Sources', zorder=5)
-        all_x.extend(sx)
-        all_y.extend(sy)
+        source_xy = np.asarray(sources, dtype=np.float64).reshape(len(sources), -1)[:, :2]
+        ax.scatter(source_xy[:, 0], source_xy[:, 1], color='yellow', marker='*', s=1000, edgecolors='black', linewidths=3, label='Sources', zorder=5)
+        all_xy.append(source_xy)
 
     ax.set_xlabel("X-axis [cm]", fontproperties=_font_prop, fontsize=20)
     ax.set_ylabel("Y-axis [cm]", fontproperties=_font_prop, fontsize=20)
@@ -207,9 +331,7 @@ def visualize_routes_2d(routes, sources, map_data=None):
     ax.minorticks_on()
     ax.tick_params(axis='both', which='minor', labelsize=16)
     
-    legend = ax.legend(fontsize=18, loc='best')
-    for text in legend.get_texts():
-        text.set_font_properties(_font_prop)
+    ax.legend(prop=_legend_font(18), loc='best')
         
     ax.grid(True, alpha=0.35, linewidth=1.6)
 
@@ -224,17 +346,17 @@ def visualize_routes_2d(routes, sources, map_data=None):
         ax.set_aspect('equal', adjustable='datalim')
     else:
         # map_dataがない場合は従来通りデータに基づいて範囲を設定
-        if all_x and all_y:
-            min_x, max_x = min(all_x), max(all_x)
-            min_y, max_y = min(all_y), max(all_y)
+        if all_xy:
+            all_xy = np.concatenate(all_xy)
+            min_x, min_y = all_xy.min(axis=0).tolist()
+            max_x, max_y = all_xy.max(axis=0).tolist()
             pad_x = (max_x - min_x) * 0.1 if max_x > min_x else 1
             pad_y = (max_y - min_y) * 0.1 if max_y > min_y else 1
             ax.set_xlim(min_x - pad_x, max_x + pad_x)
             ax.set_ylim(min_y - pad_y, max_y + pad_y)
             ax.set_aspect('equal', adjustable='datalim')
     
-    # 最後に tight_layout を適用
-    plt.tight_layout()
+    # ★余白は図の作成時に指定した constrained レイアウトで描画時に調整される（tight_layout は呼ばない）
     plt.show()
 
 
@@ -242,12 +364,19 @@ def plot_dose_profile(results, routes):
     """
     各経路の詳細な線量プロファイルを1つのグラフにまとめてプロットする。
     """
+    import matplotlib.pyplot as plt
     set_japanese_font()
+    _tune_rendering()
     
-    fig, ax = plt.subplots(figsize=(12, 7))
+    fig, ax = plt.subplots(figsize=(12, 7), num=_FIG_DOSE_PROFILE, clear=True)
     
     has_data_to_plot = False
 
+    # ★結果の名前 ('route_1' など) から経路情報を引く辞書をループの前に1回だけ作る
+    routes_by_name = {f"route_{i + 1}": r for i, r in enumerate(routes)}
+    # 経路情報が見つからない結果に使う色（i/N の値でまとめて1回で引く）
+    fallback_colors = _viridis_colors(len(results))
+
     # 1. 詳細線量プロット
     for i, (route_name, result_data) in enumerate(results.items()):
         doses = result_data.get("doses", [])
@@ -257,16 +386,16 @@ def plot_dose_profile(results, routes):
         has_data_to_plot = True
         
         # 対応する経路情報を見つける
-        route_info = next((r for r in routes if f"route_{routes.index(r)+1}" == route_name), None)
+        route_info = routes_by_name.get(route_name)
         if not route_info or "step_width" not in route_info:
-            distances = list(range(len(doses)))
+            distances = np.arange(len(doses))
             xlabel = "評価点インデックス"
         else:
             step_width = route_info["step_width"]
-            distances = [j * step_width for j in range(len(doses))]
+            distances = np.arange(len(doses)) * step_width
             xlabel = "経路に沿った距離 [cm]"
 
-        color = route_info.get('color', 'gray') if route_info else plt.cm.viridis(i / len(results))
+        color = route_info.get('color', 'gray') if route_info else fallback_colors[i]
 
         ax.plot(distances, doses, marker='o', markersize=12, linestyle='-', linewidth=4, label=f"{route_name}", color=color)
 
@@ -278,7 +407,7 @@ def plot_dose_profile(results, routes):
         ax.tick_params(axis='both', which='major', labelsize=18, width=1.4)
         ax.minorticks_on()
         ax.tick_params(axis='both', which='minor', labelsize=16)
-        ax.legend(prop=_font_prop, fontsize=18, loc='best')
+        ax.legend(prop=_legend_font(18), loc='best')
         ax.grid(True, which="major", ls="--", alpha=0.7, linewidth=1.7)
         ax.grid(True, which="minor", ls=":", alpha=0.5, linewidth=1.1)
         plt.tight_layout()
@@ -298,26 +427,26 @@ def visualize_astar_evaluation(eval_data, path, map_data, eval_type='f'):
         map_data (list[list[int]]): マップデータ (壁情報)
         eval_type (str): 表示する評価値のタイプ ('f', 'g', 'h')
     """
+    import matplotlib.pyplot as plt
     set_japanese_font()
+    _tune_rendering()
     
     from app_config import MAP_ROWS, MAP_COLS
-    import numpy as np
     
     # 評価値マップを作成 (訪問していないノードはNaN)
+    # ★評価値を持つノードの行・列・値を配列にまとめ、1回の代入で書き込む
     eval_map = np.full((MAP_ROWS, MAP_COLS), np.nan)
     
-    for (r, c), values in eval_data.items():
-        if eval_type in values:
-            eval_map[r, c] = values[eval_type]
+    entries = [(r, c, values[eval_type]) for (r, c), values in eval_data.items() if eval_type in values]
+    if entries:
+        rs, cs, vals = zip(*entries)
+        eval_map[list(rs), list(cs)] = vals
     
     # 壁の位置にもNaNを設定
-    for r in range(MAP_ROWS):
-        for c in range(MAP_COLS):
-            if map_data[r][c] == 1:
-                eval_map[r, c] = np.nan
+    eval_map[np.asarray(map_data)[:MAP_ROWS, :MAP_COLS] == 1] = np.nan
     
     # 図を作成
-    fig, ax = plt.subplots(figsize=(12, 10))
+    fig, ax = plt.subplots(figsize=(12, 10), num=_FIG_ASTAR_EVAL, clear=True)
     
     # ヒートマップを描画
     im = ax.imshow(eval_map, cmap='viridis', origin='upper', interpolation='nearest')
@@ -346,9 +475,7 @@ def visualize_astar_evaluation(eval_data, path, map_data, eval_type='f'):
         ax.plot(path_cols[-1], path_rows[-1], 'r*', markersize=20, label='ゴール', markeredgecolor='black', markeredgewidth=2)
     
     # 凡例を追加
-    legend = ax.legend(fontsize=12, loc='upper right')
-    for text in legend.get_texts():
-        text.set_font_properties(_font_prop)
+    ax.legend(prop=_legend_font(12), loc='upper right')
     
     # グリッドを追加
     ax.set_xticks(range(0, MAP_COLS, max(1, MAP_COLS // 20)))